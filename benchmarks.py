@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""
+Benchmarks for htmlement.
+
+Each benchmark builds a document of a given size, and reports how long it takes to parse it,
+or how much memory the parsed tree uses.
+Run this file directly to print the results, e.g.
+
+    python benchmarks.py
+"""
+import tracemalloc
+import io
+import timeit
+import htmlement
+
+
+def timed(func, repeat=3):
+    """Return the best time, in seconds, of calling *func*."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def traced(func):
+    """Return the memory, in megabytes, that is still allocated by the result of calling *func*."""
+    tracemalloc.start()
+    try:
+        result = func()  # noqa: F841
+        return tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def peak(func):
+    """Return the peak memory, in megabytes, that is allocated while calling *func*."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def listing(size):
+    """Return a listing page, with *size* rows."""
+    row = "<div class='row' data-id='{0}'><a href='/item/{0}'>Item {0}</a><span class='price'>{0}.99</span></div>\n"
+    return "<html><body>" + "".join(row.format(i) for i in range(size)) + "</body></html>"
+
+
+def modern(size):
+    """Return a page, with *size* cards, that is full of scripts, styles, inline svg icons and comments."""
+    icon = "<svg viewBox='0 0 24 24'><g fill='none'>" + "<path d='M12 2L2 7l10 5 10-5-10-5z'/>" * 8 + "</g></svg>"
+    card = "".join(("<!-- card {0} --><div class='card'><style>.c{0} {{color: red}}</style>", icon,
+                    "<a href='/item/{0}'>Item {0}</a><script>track({{id: {0}, name: 'item'}});</script></div>\n"))
+    return "<html><body>" + "".join(card.format(i) for i in range(size)) + "</body></html>"
+
+
+PRUNED = {"script", "style", "svg", "noscript"}
+
+
+def bench_unclosed(size):
+    """
+    Deeply nested elements that are never closed, followed by stray end tags
+    that do not match any open element. Parse time should scale linearly with *size*.
+    """
+    html = "<html><body>" + "<div><p><li>" * size + "</span></td>" * size + "</body></html>"
+    return timed(lambda: htmlement.fromstring(html))
+
+
+def bench_recover(size):
+    """
+    Unclosed elements that are all closed by a single end tag, repeated *size* times.
+    """
+    html = "<html><body>" + "<section><div><p><span>text</section>" * size + "</body></html>"
+    return timed(lambda: htmlement.fromstring(html))
+
+
+def bench_modern(size):
+    """A modern page, parsed with every subtree."""
+    html = modern(size)
+    return timed(lambda: htmlement.fromstring(html))
+
+
+def bench_pruned(size):
+    """A modern page, parsed without scripts, styles, svg icons and comments."""
+    html = modern(size)
+    return timed(lambda: htmlement.fromstring(html, skip_tags=PRUNED, comments=False))
+
+
+def bench_stdlib(size):
+    """A listing page, tokenized by HTMLParser."""
+    html = listing(size)
+    return timed(lambda: htmlement.fromstring(html, engine="stdlib"))
+
+
+def bench_fast(size):
+    """A listing page, tokenized in bulk by the fast engine."""
+    html = listing(size)
+    return timed(lambda: htmlement.fromstring(html, engine="fast"))
+
+
+QUERIES = [".//div[@data-id='{}']/a".format(i) for i in range(20)]
+QUERIES += [".//div[@class='row']/span[{}]".format(i + 1) for i in range(16)]
+QUERIES += [".//span[@class='price']", ".//a[@href]", ".//div/a", "body/div[last()]"]
+
+
+def bench_findall(size):
+    """Many queries on a listing page, evaluated one at a time."""
+    root = htmlement.fromstring(listing(size))
+    return timed(lambda: [root.findall(path) for path in QUERIES])
+
+
+def bench_queryset(size):
+    """Many queries on a listing page, evaluated in one traversal."""
+    root = htmlement.fromstring(listing(size))
+    queries = htmlement.QuerySet(QUERIES)
+    return timed(lambda: queries.findall(root))
+
+
+FIELDS = {"id": "@data-id", "link": "a/@href", "title": "a", "price": "span[@class='price']"}
+
+
+def feed(size):
+    """Return a feed page, with *size* records between a modern page header and footer."""
+    chrome = modern(max(size // 10, 1))
+    records = listing(size)[len("<html><body>"):-len("</body></html>")]
+    page = "".join((chrome[:-len("</body></html>")], "<main>", records, "</main>", chrome[len("<html><body>"):]))
+    return page.encode("utf-8")
+
+
+def iterfind_records(html):
+    root = htmlement.parse(io.BytesIO(html), encoding="utf-8")
+    return [{"id": elem.get("data-id"), "link": elem.find("a").get("href"), "title": elem.findtext("a"),
+             "price": elem.findtext("span[@class='price']")} for elem in root.iterfind(".//div[@class='row']")]
+
+
+def extract_records(html):
+    return list(htmlement.extract(io.BytesIO(html), "div", {"class": "row"}, FIELDS, encoding="utf-8"))
+
+
+def bench_iterfind(size):
+    """Records from a feed page, parsed into a tree and then found with iterfind."""
+    html = feed(size)
+    return timed(lambda: iterfind_records(html))
+
+
+def bench_extract(size):
+    """Records from a feed page, extracted while parsing."""
+    html = feed(size)
+    return timed(lambda: extract_records(html))
+
+
+def page_titles(root):
+    return [elem.text for elem in root.iterfind(".//a")]
+
+
+def bench_serial(size):
+    """*size* listing pages, parsed one after the other."""
+    pages = [listing(500) for _ in range(size)]
+    return timed(lambda: [page_titles(htmlement.fromstring(html)) for html in pages], repeat=1)
+
+
+def bench_parse_many(size):
+    """*size* listing pages, parsed over a pool with a worker for every cpu."""
+    pages = [listing(500) for _ in range(size)]
+    return timed(lambda: list(htmlement.parse_many(pages, extract=page_titles)), repeat=1)
+
+
+def bench_whole(size):
+    """A huge flat table, with *size* rows, parsed in one go."""
+    html = listing(size).replace("<body>", "<body><main>").replace("</body>", "</main></body>")
+    return timed(lambda: htmlement.fromstring(html, "main"), repeat=1)
+
+
+def bench_split(size):
+    """A huge flat table, with *size* rows, split into segments that are parsed over a pool with a worker for every cpu."""
+    html = listing(size).replace("<body>", "<body><main>").replace("</body>", "</main></body>")
+    return timed(lambda: htmlement.parse_split(html, "main", segment_size=1 << 20), repeat=1)
+
+
+def bench_uncached(size):
+    """A listing page, that is parsed again every time."""
+    html = listing(size)
+    return timed(lambda: htmlement.fromstring(html))
+
+
+def bench_cached(size):
+    """A listing page, that is returned from the parse cache every time."""
+    html = listing(size)
+    cache = htmlement.ParseCache()
+    cache.fromstring(html)
+    return timed(lambda: cache.fromstring(html))
+
+
+def memory_element(size):
+    """Memory used by a listing page, parsed into an Element tree."""
+    html = listing(size)
+    return traced(lambda: htmlement.fromstring(html))
+
+
+def memory_compact(size):
+    """Memory used by a listing page, parsed into a compact tree."""
+    html = listing(size)
+    return traced(lambda: htmlement.fromstring(html, target=htmlement.CompactTreeBuilder()))
+
+
+def memory_modern(size):
+    """Memory used by a modern page, parsed with every subtree."""
+    html = modern(size)
+    return traced(lambda: htmlement.fromstring(html))
+
+
+def memory_pruned(size):
+    """Memory used by a modern page, parsed without scripts, styles, svg icons and comments."""
+    html = modern(size)
+    return traced(lambda: htmlement.fromstring(html, skip_tags=PRUNED, comments=False))
+
+
+def memory_documents(size):
+    """Memory used by *size* small listing pages that are kept in memory, without shared names."""
+    pages = [listing(20) for _ in range(size)]
+    return traced(lambda: [htmlement.fromstring(html, intern_names=False) for html in pages])
+
+
+def memory_interned(size):
+    """Memory used by *size* small listing pages that are kept in memory, with shared names."""
+    pages = [listing(20) for _ in range(size)]
+    return traced(lambda: [htmlement.fromstring(html) for html in pages])
+
+
+def memory_iterfind(size):
+    """Peak memory of finding the records of a feed page with iterfind."""
+    html = feed(size)
+    return peak(lambda: iterfind_records(html))
+
+
+def memory_extract(size):
+    """Peak memory of extracting the records of a feed page while parsing."""
+    html = feed(size)
+    return peak(lambda: extract_records(html))
+
+
+def report(title, benchmarks, sizes, fmt):
+    print("{:<20}".format(title) + "".join("{:>12}".format(size) for size in sizes))
+    for bench in benchmarks:
+        results = [bench(size) for size in sizes]
+        print("{:<20}".format(bench.__name__) + "".join(fmt.format(result) for result in results))
+    print()
+
+
+def main():
+    report("time", [bench_unclosed, bench_recover], [1000, 2000, 4000, 8000], "{:>11.4f}s")
+    report("time", [bench_modern, bench_pruned], [1000, 2000, 4000, 8000], "{:>11.4f}s")
+    report("time", [bench_stdlib, bench_fast], [1000, 10000, 50000], "{:>11.4f}s")
+    report("time", [bench_findall, bench_queryset], [1000, 2000, 4000, 8000], "{:>11.4f}s")
+    report("time", [bench_iterfind, bench_extract], [1000, 2000, 4000, 8000], "{:>11.4f}s")
+    report("time", [bench_serial, bench_parse_many], [100, 400, 1600], "{:>11.4f}s")
+    report("time", [bench_whole, bench_split], [50000, 200000], "{:>11.4f}s")
+    report("time", [bench_uncached, bench_cached], [1000, 2000, 4000, 8000], "{:>11.4f}s")
+    report("memory", [memory_element, memory_compact], [1000, 10000, 50000], "{:>10.1f}MB")
+    report("memory", [memory_modern, memory_pruned], [1000, 10000, 50000], "{:>10.1f}MB")
+    report("memory", [memory_documents, memory_interned], [100, 1000, 5000], "{:>10.1f}MB")
+    report("memory", [memory_iterfind, memory_extract], [1000, 10000, 50000], "{:>10.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,22 +36,126 @@ Maintainability: https://codeclimate.com/github/willforde/python-htmlement/maint
 
 # Standard Lib
 import xml.etree.ElementTree as Etree
+from xml.etree import ElementPath
+import collections
+import contextlib
+import functools
 import warnings
+import threading
+import sys
+import weakref
+import codecs
+import itertools
+import hashlib
+import pickle
+import os
+import array
+import mmap
 import re
+import io
 
 # HTML Parser
 from html.entities import name2codepoint
+from html import unescape
 from html.parser import HTMLParser
 
-__all__ = ["HTMLement", "fromstring", "fromstringlist", "parse"]
+# Optional parsers, that can be used as the backend of the parser when installed
+try:
+    from lxml import etree as _lxml
+except ImportError:  # pragma: no cover
+    _lxml = None
+
+try:
+    import html5_parser as _html5_parser
+except (ImportError, RuntimeError):  # pragma: no cover
+    # RuntimeError is raised when html5-parser and lxml are built against different versions of libxml2
+    _html5_parser = None
+
+__all__ = ["HTMLement", "Filter", "CompactTreeBuilder", "CompactElement", "IndexBuilder", "fromstring", "fromstringlist",
+           "QuerySet", "ParseResult", "parse", "iterparse", "itersections", "extract", "parse_many",
+           "parse_async", "aiterparse", "parse_split", "itersplit", "ParseCache"]
 __version__ = "2.0.0"
 
-# Add missing codepoints
-# TODO: This may no longer be required
-name2codepoint["apos"] = 0x0027
+# Codepoints of the named entities, with the missing apos entity added to a copy,
+# so the module level table of html.entities is left as it is for everyone else
+_CODEPOINTS = dict(name2codepoint, apos=0x0027)
+
+# Byte order marks take precedence over every other source of encoding information
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"),
+         (codecs.BOM_UTF16_LE, "utf-16"),
+         (codecs.BOM_UTF16_BE, "utf-16"))
+
+# Only the start of the document is scanned for the charset
+# Refer to: https://html.spec.whatwg.org/multipage/parsing.html#prescan-a-byte-stream-to-determine-its-encoding
+_PRESCAN_SIZE = 1024
+_META_RE = re.compile(br"<meta[\s/][^>]*>", re.IGNORECASE)
+_CHARSET_RE = re.compile(br"charset\s*=\s*[\"']?\s*([-\w.:]+)", re.IGNORECASE)
+_XML_DECL_RE = re.compile(br"<\?xml[^>]+encoding\s*=\s*[\"']([-\w.:]+)", re.IGNORECASE)
+
+# Elements that have there content parsed as raw text, any tags within them are not real tags
+_RAW_TEXT = tuple(HTMLParser.CDATA_CONTENT_ELEMENTS) + tuple(getattr(HTMLParser, "RCDATA_CONTENT_ELEMENTS", ()))
+_RAW_TEXT_END = {tag: re.compile(r"</{}\s*>".format(tag), re.IGNORECASE) for tag in _RAW_TEXT}
+
+# The common tokens that the fast engine handles itself, in one match. Everything else, e.g. declarations,
+# processing instructions, raw text and unusual markup, is handed to the methods of HTMLParser.
+_FAST_TOKEN_RE = re.compile(r"""
+    <(?:
+        (?P<start>[a-zA-Z][-.a-zA-Z0-9:_]*)(?=[\t\n\r\f />])
+        (?P<attrs>(?:\s+[^\s/>"'=<]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'=<>`]+))?)*)
+        \s*(?P<close>/?)>
+      | /(?P<end>[a-zA-Z][-.a-zA-Z0-9:_]*)\s*>
+      | !--(?!-?>)(?P<comment>[^-]*(?:-[^-]+)*)-->
+    )""", re.VERBOSE)
+_FAST_ATTR_RE = re.compile(r"""\s+([^\s/>"'=<]+)(?:\s*(=)\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?""")
+_PARTIAL_REF_RE = re.compile(r"[\s;]")
+
+# The options of HTMLement, that are the callbacks
+_CALLBACKS = ("on_start", "on_end", "on_text", "on_comment")
+
+# The backends that can be used, and the one that is used for "auto", which is the fastest one that is installed.
+# lxml is preferred over html5-parser, as it parses incrementally, and html5-parser depends on it anyway
+_BACKENDS = {"stdlib": True, "lxml": _lxml is not None, "html5-parser": _html5_parser is not None}
+_AUTO_BACKEND = "lxml" if _lxml is not None else "html5-parser" if _html5_parser is not None else "stdlib"
+
+# Some tags in html do not require closing tags so thoes tags will need to be auto closed (Void elements)
+# Refer to: https://www.w3.org/TR/html/syntax.html#void-elements
+_VOIDS = frozenset(("area", "base", "br", "col", "hr", "img", "input", "link", "meta", "param",
+                    # Only in HTML5
+                    "embed", "keygen", "source", "track",
+                    # Not supported in HTML5
+                    "basefont", "frame", "isindex",
+                    # SVG self closing tags
+                    "rect", "circle", "ellipse", "line", "polyline", "polygon",
+                    "path", "stop", "use", "image", "animatetransform"))
+
+# Tag and attribute names are shared between all parsed trees, instead of every tree having its own copies
+# The table is pre-seeded with the common html vocabulary, and stops growing once the limit is reached
+_NAMES_LIMIT = 4096
+_NAMES = {name: name for name in _VOIDS.union(
+    # Common tags
+    ("html", "head", "title", "body", "div", "span", "p", "a", "ul", "ol", "li", "dl", "dt", "dd", "table", "thead",
+     "tbody", "tfoot", "tr", "td", "th", "form", "label", "select", "option", "textarea", "button", "h1", "h2", "h3",
+     "h4", "h5", "h6", "b", "i", "u", "em", "strong", "small", "code", "pre", "blockquote", "header", "footer", "nav",
+     "main", "section", "article", "aside", "figure", "figcaption", "picture", "video", "audio", "iframe", "script",
+     "style", "noscript", "template", "svg", "g", "text",
+     # Common attributes
+     "id", "class", "style", "href", "src", "srcset", "alt", "title", "name", "type", "value", "rel", "content",
+     "charset", "width", "height", "lang", "target", "role", "action", "method", "for", "placeholder", "loading",
+     "tabindex", "hidden", "disabled", "checked", "selected", "viewbox", "fill", "d"))}
+
+
+def _intern(name):
+    """Return the shared copy of a tag or attribute name, adding the name to the table if there is still room."""
+    try:
+        return _NAMES[name]
+    except KeyError:
+        if len(_NAMES) < _NAMES_LIMIT:
+            # setdefault, so threads that add the same name at the same time, all get the same copy
+            return _NAMES.setdefault(name, name)
+        return name
 
 
-def fromstring(text, tag="", attrs=None, encoding=None):
+def fromstring(text, tag="", attrs=None, encoding=None, transport_encoding=None, sections=None, **options):
     """
     Parse's "HTML" document from a string into an element tree.
 
@@ -67,17 +171,26 @@ def fromstring(text, tag="", attrs=None, encoding=None):
     :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
     :type encoding: str
 
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param sections: (optional) Named sections to parse in one pass, given as {'name': ('tag', attrs)}.
+                     A dict of {'name': element} is returned instead of the root element.
+    :type sections: dict(str, tuple(str, dict(str, str)))
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *target*.
+
     :return: The root element of the element tree.
     :rtype: xml.etree.ElementTree.Element
 
     :raises UnicodeDecodeError: If decoding of *text* fails.
     """
-    parser = HTMLement(tag, attrs, encoding)
+    parser = HTMLement(tag, attrs, encoding, transport_encoding, sections=sections, **options)
     parser.feed(text)
     return parser.close()
 
 
-def fromstringlist(sequence, tag="", attrs=None, encoding=None):
+def fromstringlist(sequence, tag="", attrs=None, encoding=None, transport_encoding=None, sections=None, **options):
     """
     Parses an "HTML document" from a sequence of "HTML sections" into an element tree.
 
@@ -93,23 +206,35 @@ def fromstringlist(sequence, tag="", attrs=None, encoding=None):
     :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
     :type encoding: str
 
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param sections: (optional) Named sections to parse in one pass, given as {'name': ('tag', attrs)}.
+                     A dict of {'name': element} is returned instead of the root element.
+    :type sections: dict(str, tuple(str, dict(str, str)))
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *target*.
+
     :return: The root element of the element tree.
     :rtype: xml.etree.ElementTree.Element
 
     :raises UnicodeDecodeError: If decoding of a section within *sequence* fails.
     """
-    parser = HTMLement(tag, attrs, encoding)
+    parser = HTMLement(tag, attrs, encoding, transport_encoding, sections=sections, **options)
     for text in sequence:
         parser.feed(text)
     return parser.close()
 
 
-def parse(source, tag="", attrs=None, encoding=None):
+def parse(source, tag="", attrs=None, encoding=None, transport_encoding=None, sections=None,
+          buffer_size=65536, memory_map=False, **options):
     """
     Load an external "HTML document" into an element tree.
 
+    Files are read in binary mode, so the encoding can be sniffed from the "meta tags" of the document.
+
     :param source: A filename or file like object containing HTML data.
-    :type source: str or io.TextIOBase
+    :type source: str or io.BufferedIOBase or io.TextIOBase
 
     :param str tag: (optional) Name of "tag / element" which is used to filter down "the tree" to a required section.
     :type tag: str
@@ -120,324 +245,2744 @@ def parse(source, tag="", attrs=None, encoding=None):
     :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
     :type encoding: str
 
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param sections: (optional) Named sections to parse in one pass, given as {'name': ('tag', attrs)}.
+                     A dict of {'name': element} is returned instead of the root element.
+    :type sections: dict(str, tuple(str, dict(str, str)))
+
+    :param int buffer_size: (optional) Number of bytes to read from *source* at a time.
+
+    :param bool memory_map: (optional) Memory map *source* instead of reading it, if *source* supports it.
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *target*.
+
     :return: The root element of the element tree.
     :rtype: xml.etree.ElementTree.Element
 
     :raises UnicodeDecodeError: If decoding of *source* fails.
     """
-    # Assume that source is a file pointer if no read methods is found
-    if not hasattr(source, "read"):
-        source = open(source, "r", encoding=encoding)
-        close_source = True
-    else:
-        close_source = False
-
-    try:
-        parser = HTMLement(tag, attrs, encoding)
-        while True:
-            # Read in 64k at a time
-            data = source.read(65536)
-            if not data:
+    parser = HTMLement(tag, attrs, encoding, transport_encoding, sections=sections, **options)
+    with contextlib.closing(_iter_source(source, buffer_size, memory_map)) as chunks:
+        for data in chunks:
+            parser.feed(data)
+            # Stop reading as soon as the required section has been parsed
+            if parser._finished:
                 break
 
-            # Feed the parser
+    # Return the root element
+    return parser.close()
+
+
+def iterparse(source, events=None, tag=None, encoding=None, transport_encoding=None, buffer_size=65536, **options):
+    """
+    Incrementally parse an external "HTML document", reporting what's going on to the user.
+
+    Elements are reported as soon as they are opened or closed by the parser, so they can be
+    processed and then cleared, without the need to wait for the whole "element tree" to be built.
+    To keep memory bounded by the depth of the tree, clear the elements after they have been processed. ::
+
+        for event, elem in htmlement.iterparse(source, events=("start", "end")):
+            if event == "start" and elem.tag == "table":
+                table = elem
+            elif event == "end" and elem.tag == "tr":
+                process(elem)
+                table.clear()
+
+    :param source: A filename or file like object containing HTML data.
+    :type source: str or io.BufferedIOBase or io.TextIOBase
+
+    :param events: (optional) The events to report, any of "start", "end" and "comment". Defaults to ("end",).
+    :type events: collections.abc.Sequence[str]
+
+    :param tag: (optional) Only report events for elements with this tag name.
+    :type tag: str
+
+    :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
+    :type encoding: str
+
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param int buffer_size: (optional) Number of bytes to read from *source* at a time.
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *skip_tags*.
+
+    :return: A generator of (event, elem) tuples.
+    :rtype: collections.abc.Iterator[tuple[str, xml.etree.ElementTree.Element]]
+
+    :raises UnicodeDecodeError: If decoding of *source* fails.
+    """
+    parser = HTMLement(encoding=encoding, transport_encoding=transport_encoding, events=events or ("end",), **options)
+    with contextlib.closing(_iter_source(source, buffer_size)) as chunks:
+        for data in chunks:
             parser.feed(data)
+            for event, elem in parser.read_events():
+                if tag is None or elem.tag == tag:
+                    yield event, elem
 
-        # Return the root element
-        return parser.close()
+    parser.close()
+    for event, elem in parser.read_events():
+        if tag is None or elem.tag == tag:
+            yield event, elem
 
-    finally:
-        if close_source:
-            source.close()
 
+def itersections(source, tag, attrs=None, encoding=None, transport_encoding=None, buffer_size=65536, **options):
+    """
+    Incrementally parse every section of an external "HTML document" that matches the search criteria.
 
-class HTMLement(object):
+    Only the matching sections are built, each section is returned as soon as it's closed
+    and everything between the sections is skipped. Nested matches are part of the outer section.
+
+    :param source: A filename or file like object containing HTML data.
+    :type source: str or io.BufferedIOBase or io.TextIOBase
+
+    :param str tag: Name of "tag / element" which is used to filter down "the tree" to the required sections.
+    :type tag: str
+
+    :param attrs: (optional) The attributes of the element, that will be used, when searchingfor the required sections.
+    :type attrs: dict(str, str)
+
+    :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
+    :type encoding: str
+
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param int buffer_size: (optional) Number of bytes to read from *source* at a time.
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *skip_tags*.
+
+    :return: A generator of the root elements of the matching sections.
+    :rtype: collections.abc.Iterator[xml.etree.ElementTree.Element]
+
+    :raises UnicodeDecodeError: If decoding of *source* fails.
+    :raises RuntimeError: If no element matching search criteria was found.
     """
-    Python HTMLParser extension with ElementTree Parser support.
+    parser = HTMLement(tag, attrs, encoding, transport_encoding, multiple=True, **options)
+    with contextlib.closing(_iter_source(source, buffer_size)) as chunks:
+        for data in chunks:
+            parser.feed(data)
+            for elem in parser.read_sections():
+                yield elem
 
-    This HTML Parser extends :class:`html.parser.HTMLParser`, returning an :class:`xml.etree.ElementTree.Element`
-    instance. The returned root element natively supports the ElementTree API.
-    (e.g. you may use its limited support for `XPath expressions`__)
+    for elem in parser.close():
+        yield elem
 
-    When a "tag" and "tag attributes" are given the parser will search for a required section. Only when the required
-    section is found, does the parser start parsing the "HTML document". The element that matches the search criteria
-    will then become the new "root element".
 
-    Attributes are given as a dict of {'name': 'value'}. Value can be the string to match, `True` or `False.`
-    `True` will match any attribute with given name and any value.
-    `False` will only give a match if given attribute does not exist in the element.
+def extract(source, tag, attrs=None, fields=None, encoding=None, transport_encoding=None, buffer_size=65536,
+            **options):
+    """
+    Incrementally extract records from an external "HTML document", without building the whole element tree.
 
-    :param str tag: (optional) Name of "tag / element" which is used to filter down "the tree" to a required section.
+    Every section that matches the search criteria is a record. The fields of each record are given
+    as a dict of {'name': 'path'}, where the path is relative to the record element and ends with ``/@attr``
+    to extract the value of an attribute instead of the text. The text is the stripped text of the first matching
+    element, including the text of its children. Fields without a match are None. ::
+
+        fields = {"title": "h2", "link": "a/@href", "price": ".//span[@class='price']", "id": "@data-id"}
+        for record in htmlement.extract(source, "div", {"class": "item"}, fields):
+            print(record["title"], record["link"])
+
+    Everything between the records is skipped, and the fields are matched while the records are parsed, so no
+    elements are built. Paths that need more than the ancestors of an element, e.g. a ``[tag]`` or ``[last()]``
+    predicate, are supported by building one record at a time and then using a :class:`QuerySet`.
+
+    :param source: A filename or file like object containing HTML data.
+    :type source: str or io.BufferedIOBase or io.TextIOBase
+
+    :param str tag: Name of "tag / element" of the records.
     :type tag: str
 
-    :param attrs: (optional) The attributes of the element, that will be used, when searchingfor the required section.
+    :param attrs: (optional) The attributes of the element, that will be used, when searchingfor the records.
     :type attrs: dict(str, str)
 
+    :param fields: The fields to extract from each record, given as {'name': 'path'}.
+    :type fields: dict(str, str)
+
     :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
     :type encoding: str
 
-    .. _Xpath: https://docs.python.org/3.6/library/xml.etree.elementtree.html#xpath-support
-    __ XPath_
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param int buffer_size: (optional) Number of bytes to read from *source* at a time.
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *skip_tags*.
+
+    :return: A generator of dicts of {'name': value}, one for each record.
+    :rtype: collections.abc.Iterator[dict(str, str)]
+
+    :raises UnicodeDecodeError: If decoding of *source* fails.
+    :raises RuntimeError: If no element matching search criteria was found.
     """
-    def __init__(self, tag="", attrs=None, encoding=None):
-        self._parser = ParseHTML(tag, attrs)
-        self.encoding = encoding
-        self._finished = False
+    target = _RecordBuilder(fields or {})
+    for record in itersections(source, tag, attrs, encoding, transport_encoding, buffer_size, target=target, **options):
+        yield record
 
-    def feed(self, data):
-        """
-        Feeds data to the parser.
 
-        If *data*, is of type :class:`bytes` and where no encoding was specified, then the encoding
-        will be extracted from *data* using "meta tags", if available.
-        Otherwise encoding will default to "ISO-8859-1"
+ParseResult = collections.namedtuple("ParseResult", ("index", "result", "error"))
+ParseResult.__doc__ = """
+The result of parsing one of the documents given to :func:`parse_many`.
 
-        :param data: HTML data
-        :type data: str or bytes
+:ivar int index: The position of the document within the sources.
+:ivar result: The root element, or what *extract* returned for it. None if parsing failed.
+:ivar Exception error: The exception that was raised while parsing the document, or None.
+"""
 
-        :raises UnicodeDecodeError: If decoding of *data* fails.
-        """
-        # Skip feeding data into parser if we already have what we want
-        if self._finished == 1:
-            return None
 
-        # Make sure that we have unicode before continuing
-        if isinstance(data, bytes):
-            if self.encoding:
-                data = data.decode(self.encoding)
-            else:
-                data = self._make_unicode(data)
+def parse_many(sources, tag="", attrs=None, workers=None, extract=None, ordered=True, chunksize=None,
+               executor="process", **options):
+    """
+    Parse many "HTML documents" in parallel, over a pool of worker processes.
 
-        # Parse the html document
-        try:
-            self._parser.feed(data)
-        except EOFError:
-            self._finished = True
-            self._parser.reset()
+    Documents are sent to the workers in batches of *chunksize*, and only a few batches per worker are queued
+    at any time, so *sources* can be a generator of any length. To keep the results that are sent back small,
+    give an *extract* function, which is called with the root element of each document within the worker.
+    It has to be picklable, e.g. a function that is defined at module level. ::
 
-    def close(self):
-        """
-        Close the "tree builder" and return the "root element" of the "element tree".
+        def titles(root):
+            return root.findtext(".//title")
 
-        :return: The "root element" of the "element tree".
-        :rtype: xml.etree.ElementTree.Element
+        for result in htmlement.parse_many(pages, extract=titles, workers=8):
+            if result.error is None:
+                print(result.index, result.result)
 
-        :raises RuntimeError: If no element matching search criteria was found.
-        """
-        return self._parser.close()
+    A document that fails to parse, is reported with the exception as its error, without stopping the batch.
 
-    def _make_unicode(self, data):
-        """
-        Convert *data* from type :class:`bytes` to type :class:`str`.
+    With ``executor="thread"`` the documents are parsed over a pool of threads instead, so nothing is pickled and
+    *extract* can be any callable. This only runs in parallel on a free-threaded build of Python, e.g. 3.13t,
+    otherwise it's mainly useful when *sources* are paths on slow storage.
 
-        :param data: The html document.
-        :type data: bytes
+    :param sources: The documents to parse. Each document is either its html data, or a path to a file.
+                    Paths have to be given as :class:`os.PathLike`, e.g. :class:`pathlib.Path`,
+                    so only the path is sent to the worker, which then reads the file itself.
+    :type sources: collections.abc.Iterable[str or bytes or os.PathLike]
 
-        :return: HTML data decoded.
-        :rtype: str
-        """
-        # Atemp to find the encoding from the html source
-        end_head_tag = data.find(b"</head>")
-        if end_head_tag:
-            # Search for the charset attribute within the meta tags
-            charset_refind = b'<meta.+?charset=[\'"]*(.+?)["\'].*?>'
-            charset = re.search(charset_refind, data[:end_head_tag], re.IGNORECASE)
-            if charset:
-                self.encoding = encoding = charset.group(1).decode()
-                return data.decode(encoding)
+    :param str tag: (optional) Name of "tag / element" which is used to filter down "the tree" to a required section.
+    :type tag: str
 
-        # Decode the string into unicode using default encoding
-        warn_msg = "Unable to determine encoding, defaulting to iso-8859-1"
-        warnings.warn(warn_msg, UnicodeWarning, stacklevel=2)
-        self.encoding = "iso-8859-1"
-        return data.decode("iso-8859-1")
+    :param attrs: (optional) The attributes of the element, that will be used, when searchingfor the required section.
+    :type attrs: dict(str, str)
 
+    :param int workers: (optional) Number of worker processes. Defaults to the number of cpus.
 
-# noinspection PyAbstractClass
-class ParseHTML(HTMLParser):
-    def __init__(self, tag="", attrs=None):
-        # Initiate HTMLParser
-        HTMLParser.__init__(self)
-        self.convert_charrefs = True
-        self._root = None  # root element
-        self._data = []  # data collector
-        self._factory = Etree.Element
-        self.enabled = not tag
-        self._unw_attrs = []
-        self.tag = tag
+    :param extract: (optional) Called with the root element of each document, within the worker.
+                    What it returns is used as the result.
+    :type extract: collections.abc.Callable
 
-        # Split attributes into wanted and unwanted attributes
-        if attrs:
-            self.attrs = attrs
-            for key, value in attrs.copy().items():
-                if value == 0:
-                    self._unw_attrs.append(key)
-                    del attrs[key]
-        else:
-            self.attrs = {}
-
-        # Some tags in html do not require closing tags so thoes tags will need to be auto closed (Void elements)
-        # Refer to: https://www.w3.org/TR/html/syntax.html#void-elements
-        self._voids = frozenset(("area", "base", "br", "col", "hr", "img", "input", "link", "meta", "param",
-                                 # Only in HTML5
-                                 "embed", "keygen", "source", "track",
-                                 # Not supported in HTML5
-                                 "basefont", "frame", "isindex",
-                                 # SVG self closing tags
-                                 "rect", "circle", "ellipse", "line", "polyline", "polygon",
-                                 "path", "stop", "use", "image", "animatetransform"))
-
-        # Create temporary root element to protect from badly written sites that either
-        # have no html starting tag or multiple top level elements
-        elem = self._factory("html")
-        self._elem = [elem]
-        self._last = elem
-        self._tail = 0
+    :param bool ordered: (optional) Return the results in the order of *sources*, instead of as they are completed.
+                         Defaults to True.
 
-    def handle_starttag(self, tag, attrs):
-        self._handle_starttag(tag, attrs, self_closing=tag in self._voids)
+    :param int chunksize: (optional) Number of documents that are sent to a worker at a time.
+                          Defaults to spreading *sources* evenly over the workers, if its length is known.
 
-    def handle_startendtag(self, tag, attrs):
-        self._handle_starttag(tag, attrs, self_closing=True)
+    :param str executor: (optional) Parse over a pool of "process" or "thread" workers. Defaults to "process".
 
-    def _handle_starttag(self, tag, attrs, self_closing=False):
-        enabled = self.enabled
-        # Add tag element to tree if we have no filter or that the filter matches
-        if enabled or self._search(tag, attrs):
-            # Convert attrs to dictionary
-            attrs = {k: v or "" for k, v in attrs}
-            self._flush()
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *encoding*.
 
-            # Create the new element
-            elem = self._factory(tag, attrs)
-            self._elem[-1].append(elem)
-            self._last = elem
+    :return: A generator of the results, one for each document.
+    :rtype: collections.abc.Iterator[ParseResult]
 
-            # Only append the element to the list of elements if it's not a self closing element
-            if self_closing:
-                self._tail = 1
+    :raises ValueError: If *executor* is unknown.
+    """
+    executor = _executor_class(executor)
+
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        # Aim for a few batches per worker, so the workers that finish first can take on more
+        size = len(sources) if hasattr(sources, "__len__") else 0
+        chunksize = min(max(size // (workers * 4), 1), 64) if size else 16
+
+    parse_batch = functools.partial(_parse_batch, tag, attrs, extract, options)
+    documents = enumerate(sources)
+    batches = iter(lambda: list(itertools.islice(documents, chunksize)), [])
+    with executor(workers) as executor:
+        # The batches that are queued up, with the indexes of their documents
+        pending = {}
+        try:
+            for batch in batches:
+                pending[executor.submit(parse_batch, batch)] = [index for index, _ in batch]
+                # Only a few batches per worker are queued up, so wait for one of them before sending more
+                if len(pending) >= workers * 2:
+                    for result in _next_results(pending, ordered):
+                        yield result
+
+            while pending:
+                for result in _next_results(pending, ordered):
+                    yield result
+        finally:
+            # Stop the batches that have not been started, when the results are no longer wanted
+            for future in pending:
+                future.cancel()
+
+
+def _parse_batch(tag, attrs, extract, options, batch):
+    """Parse a batch of (index, source) documents within a worker, returning a list of :class:`ParseResult`."""
+    results = []
+    for index, source in batch:
+        try:
+            if isinstance(source, os.PathLike):
+                root = parse(source, tag, attrs, **options)
             else:
-                self._elem.append(elem)
-                self._tail = 0
+                root = fromstring(source, tag, attrs, **options)
+            results.append(ParseResult(index, extract(root) if extract else root, None))
+        except Exception as e:
+            results.append(ParseResult(index, None, e))
+    return results
 
-            # Set this element as the root element when the filter search matches
-            if not enabled:
-                self._root = elem
-                self.enabled = True
 
-    def handle_endtag(self, tag):
-        # Only process end tags when we have no filter or that the filter has been matched
-        if self.enabled and tag not in self._voids:
-            _elem = self._elem
-            _root = self._root
-            # Check that the closing tag is what's actualy expected
-            if _elem[-1].tag == tag:
-                self._flush()
-                self._tail = 1
-                self._last = elem = _elem.pop()
-                if elem is _root:
-                    raise EOFError
-
-            # If a previous element is what we actually have then the expected element was not
-            # properly closed so we must close that before closing what we have now
-            elif len(_elem) >= 2 and any(_item.tag == tag for _item in _elem):
-                self._flush()
-                self._tail = 1
-                while True:
-                    self._last = elem = _elem.pop()
-                    if elem.tag == tag:
-                        break
-                if elem is _root:
-                    raise EOFError
-            else:
-                # Unable to match the tag to an element, ignoring it
-                return None
+def _executor_class(executor):
+    """
+    Return the class of the pool of "process" or "thread" workers.
+    concurrent.futures is only imported when it's used, so importing this module stays quick.
+    """
+    import concurrent.futures
 
-    def handle_data(self, data):
-        if data.strip() and self.enabled:
-            self._data.append(data)
+    if executor == "process":
+        return concurrent.futures.ProcessPoolExecutor
+    elif executor == "thread":
+        return concurrent.futures.ThreadPoolExecutor
+    else:
+        raise ValueError("unknown executor: '{}'".format(executor))
 
-    def handle_entityref(self, name):
-        if self.enabled:
-            try:
-                name = chr(name2codepoint[name])
-            except KeyError:
-                pass
-            self._data.append(name)
 
-    def handle_charref(self, name):
-        if self.enabled:
-            try:
-                if name[0].lower() == "x":
-                    name = chr(int(name[1:], 16))
-                else:
-                    name = chr(int(name))
-            except ValueError:
-                pass
-            self._data.append(name)
+def _next_results(pending, ordered):
+    """
+    Wait for the next batch in order, or the first batch to complete, and return its results.
+    When the batch itself failed, e.g. the worker died, every document of the batch gets the error.
+    """
+    import concurrent.futures
 
-    def handle_comment(self, data):
-        data = data.strip()
-        if data and self.enabled:
-            elem = Etree.Comment(data)
-            self._elem[-1].append(elem)
+    future = next(iter(pending)) if ordered else next(concurrent.futures.as_completed(pending))
+    indexes = pending.pop(future)
+    try:
+        return future.result()
+    except Exception as e:
+        return [ParseResult(index, None, e) for index in indexes]
 
-    def close(self):
-        self._flush()
-        if self.enabled == 0:
-            msg = "Unable to find requested section with tag of '{}' and attributes of {}"
-            raise RuntimeError(msg.format(self.tag, self.attrs))
-        elif self._root is not None:
-            return self._root
-        else:
-            # Search the root element to find a proper html root element if one exists
-            tmp_root = self._elem[0]
-            proper_root = tmp_root.find("html")
-            if proper_root is None:
-                # Not proper root was found
-                return tmp_root
-            else:
-                # Proper root found
-                return proper_root
 
-    def _flush(self):
-        if self._data:
-            if self._last is not None:
-                text = "".join(self._data)
-                if self._tail:
-                    self._last.tail = text
+def parse_split(text, tag, attrs=None, child=None, workers=None, segment_size=4194304, executor="process",
+                encoding=None, transport_encoding=None, **options):
+    """
+    Parse a section of a huge "HTML document" in parallel, e.g. a giant table or a log dump,
+    where the section is a container with a flat list of repeated child elements.
+
+    The content of the section is split into segments of about *segment_size* characters, at the start tags of
+    the child elements that directly follow the end tag of a child element. The segments are parsed in parallel,
+    and their elements are then joined into one tree.
+    When a segment was split within a child element, e.g. at a nested child element or within a comment,
+    parsing carries on from that segment through the next ones in the calling thread, until a segment ends
+    at a safe point. So the tree is always the same as the one that :func:`fromstring` returns. When the children
+    are not flat at all, the whole section ends up being parsed once in the calling thread, as :func:`fromstring` does.
+
+    :param text: The html document.
+    :type text: str or bytes
+
+    :param str tag: Name of "tag / element" of the container.
+
+    :param attrs: (optional) The attributes of the container, that will be used, when searching for it.
+    :type attrs: dict(str, str)
+
+    :param str child: (optional) Name of the repeated child elements. Defaults to the first element in the container.
+
+    :param int workers: (optional) Number of workers. Defaults to the number of cpus.
+
+    :param int segment_size: (optional) Number of characters of each segment. Defaults to 4 million.
+
+    :param str executor: (optional) Parse over a pool of "process" or "thread" workers. Defaults to "process".
+
+    :param encoding: (optional) Encoding used, when *text* is of type :class:`bytes`.
+    :type encoding: str
+
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *skip_tags*.
+
+    :return: The root element of the section.
+    :rtype: xml.etree.ElementTree.Element
+
+    :raises RuntimeError: If no element matching search criteria was found.
+    :raises ValueError: If *executor* is unknown, or a *target* or callbacks are given.
+    """
+    segments = _iter_split(text, tag, attrs, child, workers, segment_size, executor, encoding, transport_encoding,
+                           options)
+    root = next(segments)
+    for segment in segments:
+        root.extend(segment)
+    return root
+
+
+def itersplit(text, tag, attrs=None, child=None, workers=None, segment_size=4194304, executor="process",
+              encoding=None, transport_encoding=None, **options):
+    """
+    Parse a section of a huge "HTML document" in parallel, in the same way as :func:`parse_split`,
+    returning the child elements of the section in order, as soon as the segment that contains them is parsed.
+    Only a few segments are parsed ahead, so the whole tree is never held in memory.
+
+    See :func:`parse_split` for the parameters.
+
+    :return: A generator of the child elements of the section.
+    :rtype: collections.abc.Iterator[xml.etree.ElementTree.Element]
+
+    :raises RuntimeError: If no element matching search criteria was found.
+    :raises ValueError: If *executor* is unknown, or a *target* or callbacks are given.
+    """
+    for segment in _iter_split(text, tag, attrs, child, workers, segment_size, executor, encoding, transport_encoding,
+                               options):
+        for elem in segment:
+            yield elem
+
+
+def _iter_split(text, tag, attrs, child, workers, segment_size, executor, encoding, transport_encoding, options):
+    """
+    Split the section into segments, parse them in parallel and return the root element of each segment in order.
+    The root element of the first segment has the attributes of the section.
+    """
+    executor = _executor_class(executor)
+    if options.get("target") is not None or any(options.get(name) for name in _CALLBACKS):
+        raise ValueError("a target or callbacks can not be used, when parsing in segments")
+
+    if not isinstance(text, str):
+        text = HTMLement(encoding=encoding, transport_encoding=transport_encoding)._decode(text, True)
+
+    # Find the start tag of the section, using the same search as when parsing the section in one go
+    finder = HTMLement(tag, attrs, **options)._parser
+    finder.rawdata = text
+    try:
+        start = finder._scan(0, True)
+    except EOFError:
+        # The section is a void element, so there is nothing to split
+        yield finder.results[None]
+        return
+    if not finder._open:
+        raise RuntimeError("Unable to find requested section with tag of '{}' and attributes of {}".format(
+            finder.tag, finder.attrs))
+    section = finder._open[0][1]
+
+    # Split the content of the section at the start tags of the child elements, that directly follow the end tag
+    # of a child element. Those are nearly always between two children, and not within a nested child element
+    if child is None:
+        match = re.compile(r"<([a-zA-Z][-.a-zA-Z0-9:_]*)").search(text, start)
+        child = match.group(1) if match else tag
+    pattern = re.compile(r"</{0}\s*>\s*(<{0}(?=[\s/>]))".format(re.escape(child)), re.IGNORECASE)
+    bounds = [start]
+    while bounds[-1] + segment_size < len(text):
+        match = pattern.search(text, bounds[-1] + segment_size)
+        if match is None:
+            break
+        bounds.append(match.start(1))
+    bounds.append(len(text))
+
+    name = section.tag
+    parse_segment = functools.partial(_parse_segment, name, options)
+    workers = workers or os.cpu_count() or 1
+    with executor(workers) as executor:
+        # The segments that are queued up, in order
+        pending = collections.deque()
+        segments = iter(zip(bounds, bounds[1:]))
+
+        # After an unsafe split, one parser is carried on through the following segments, until a safe split.
+        # No more segments are queued up in the meantime, the ones that are already queued up are wasted.
+        carry = None
+        carried = None
+        try:
+            while True:
+                if carry is None:
+                    for begin, end in itertools.islice(segments, workers * 2 - len(pending)):
+                        pending.append((begin, end, executor.submit(parse_segment, text[begin:end])))
+                if pending:
+                    begin, end, future = pending.popleft()
                 else:
-                    self._last.text = text
-            self._data = []
+                    begin, end = next(segments, (None, None))
+                    if begin is None:
+                        break
+                    future = None
+
+                if carry is None:
+                    root, state = future.result()
+                    if state == "unsafe" and end < len(text):
+                        carry, carried = _open_segment(name, options), begin
+                        _feed_segment(carry, text[begin:end])
+                        continue
+                else:
+                    if future is not None:
+                        future.cancel()
+                    state = _feed_segment(carry, text[begin:end])
+                    if state == "unsafe" and end < len(text):
+                        continue
+                    root, begin, carry = _close_segment(carry, name), carried, None
+
+                if begin == start:
+                    root.attrib = section.attrib
+                yield root
+                if state == "closed":
+                    # The end tag of the section was within this segment, so there is nothing left to parse
+                    break
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+
+def _parse_segment(tag, options, text):
+    """
+    Parse a segment of the content of a section, within an element with the tag of the section.
 
-    def _search(self, tag, attrs):
-        # Only search when the tag matches
-        if tag == self.tag:
-            # If we have required attrs to match then search all attrs for wanted attrs
-            # And also check that we do not have any attrs that are unwanted
-            if self.attrs or self._unw_attrs:
-                if attrs:
-                    wanted_attrs = self.attrs.copy()
-                    unwanted_attrs = self._unw_attrs
-                    for key, value in attrs:
-                        # Check for unwanted attrs
-                        if key in unwanted_attrs:
-                            return False
-
-                        # Check for wanted attrs
-                        elif key in wanted_attrs:
-                            c_value = wanted_attrs[key]
-                            if c_value == value or c_value == 1:
-                                # Remove this attribute from the wanted dict of attributes
-                                # to indicate that this attribute has been found
-                                del wanted_attrs[key]
-
-                    # If wanted_attrs is now empty then all attributes must have been found
-                    if not wanted_attrs:
-                        return True
-            else:
-                # We only need to match tag
-                return True
+    :return: The root element, and the state of the segment as returned by :func:`_feed_segment`.
+    :rtype: tuple[xml.etree.ElementTree.Element, str]
+    """
+    parser = _open_segment(tag, options)
+    state = _feed_segment(parser, text)
+    return _close_segment(parser, tag), state
 
-        # Unable to find required section
-        return False
+
+def _open_segment(tag, options):
+    """Return a parser for the segments of a section, that is within an element with the tag of the section."""
+    parser = HTMLement(tag, **options)
+    parser.feed("<{}>".format(tag))
+    return parser
+
+
+def _feed_segment(parser, text):
+    """
+    Feed a segment of the content of a section to the parser.
+
+    :return: Whether the segment is "safe", was "unsafe" as it ended within a child element,
+             or "closed" as it contains the end of the section.
+    :rtype: str
+    """
+    parser.feed(text)
+    if parser._finished:
+        return "closed"
+
+    # Only the section may still be open, and there may not be an unfinished tag or comment left over
+    inner = parser._parser
+    safe = len(inner._stack) == 1 and inner.cdata_elem is None and "<" not in inner.rawdata
+    return "safe" if safe else "unsafe"
+
+
+def _close_segment(parser, tag):
+    """Close the section, unless its end tag was already found, and return its root element."""
+    if not parser._finished:
+        parser.feed("</{}>".format(tag))
+    return parser.close()
+
+
+async def parse_async(source, tag="", attrs=None, encoding=None, transport_encoding=None, sections=None,
+                      buffer_size=65536, **options):
+    """
+    Parse an "HTML document" from an async iterable of chunks, e.g. the body of a http response, as it arrives.
+
+    The event loop is given a chance to run other tasks between the chunks, and large chunks are parsed
+    *buffer_size* at a time, so parsing a large page does not block the loop.
+    Reading stops as soon as the required section has been parsed, and *source* is then closed
+    if it has an aclose method, e.g. an async generator. ::
+
+        async def body(response):
+            async for chunk in response.content.iter_chunked(65536):
+                yield chunk
+
+        table = await htmlement.parse_async(body(response), "table", {"id": "results"})
+
+    :param source: The chunks of the html document.
+    :type source: collections.abc.AsyncIterable[bytes or str]
+
+    :param str tag: (optional) Name of "tag / element" which is used to filter down "the tree" to a required section.
+    :type tag: str
+
+    :param attrs: (optional) The attributes of the element, that will be used, when searchingfor the required section.
+    :type attrs: dict(str, str)
+
+    :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
+    :type encoding: str
+
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param sections: (optional) Named sections to parse in one pass, given as {'name': ('tag', attrs)}.
+                     A dict of {'name': element} is returned instead of the root element.
+    :type sections: dict(str, tuple(str, dict(str, str)))
+
+    :param int buffer_size: (optional) Maximum size of the data that is parsed, before the event loop is run.
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *target*.
+
+    :return: The root element of the element tree.
+    :rtype: xml.etree.ElementTree.Element
+
+    :raises UnicodeDecodeError: If decoding of *source* fails.
+    """
+    parser = HTMLement(tag, attrs, encoding, transport_encoding, sections=sections, **options)
+    chunks = _aiter_source(source, buffer_size)
+    try:
+        async for data in chunks:
+            parser.feed(data)
+            # Stop reading as soon as the required section has been parsed
+            if parser._finished:
+                break
+    finally:
+        await chunks.aclose()
+
+    # Return the root element
+    return parser.close()
+
+
+async def aiterparse(source, events=None, tag=None, encoding=None, transport_encoding=None, buffer_size=65536,
+                     **options):
+    """
+    Incrementally parse an "HTML document" from an async iterable of chunks, reporting what's going on to the user.
+
+    This is the asynchronous version of :func:`iterparse`. The event loop is given a chance to run other tasks
+    between the chunks, and reading stops as soon as the html root element is closed
+    or the loop over the events is stopped. ::
+
+        async for event, elem in htmlement.aiterparse(body(response), tag="a"):
+            links.append(elem.get("href"))
+
+    :param source: The chunks of the html document.
+    :type source: collections.abc.AsyncIterable[bytes or str]
+
+    :param events: (optional) The events to report, any of "start", "end" and "comment". Defaults to ("end",).
+    :type events: collections.abc.Sequence[str]
+
+    :param tag: (optional) Only report events for elements with this tag name.
+    :type tag: str
+
+    :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
+    :type encoding: str
+
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+    :type transport_encoding: str
+
+    :param int buffer_size: (optional) Maximum size of the data that is parsed, before the event loop is run.
+
+    :param options: (optional) Extra keyword arguments that are passed on to :class:`HTMLement`. e.g. *skip_tags*.
+
+    :return: An async generator of (event, elem) tuples.
+    :rtype: collections.abc.AsyncIterator[tuple[str, xml.etree.ElementTree.Element]]
+
+    :raises UnicodeDecodeError: If decoding of *source* fails.
+    """
+    parser = HTMLement(encoding=encoding, transport_encoding=transport_encoding, events=events or ("end",), **options)
+    chunks = _aiter_source(source, buffer_size)
+    try:
+        async for data in chunks:
+            parser.feed(data)
+            for event, elem in parser.read_events():
+                if tag is None or elem.tag == tag:
+                    yield event, elem
+            if parser._finished:
+                break
+    finally:
+        await chunks.aclose()
+
+    parser.close()
+    for event, elem in parser.read_events():
+        if tag is None or elem.tag == tag:
+            yield event, elem
+
+
+async def _aiter_source(source, buffer_size):
+    """
+    Return the chunks of an async iterable, split into parts of at most *buffer_size*,
+    giving the event loop a chance to run between them. *source* is closed once the chunks are closed.
+
+    :param source: The chunks of the html document.
+    :type source: collections.abc.AsyncIterable[bytes or str]
+
+    :param int buffer_size: The maximum size of each part.
+
+    :return: An async generator of the parts.
+    :rtype: collections.abc.AsyncIterator[bytes or str]
+    """
+    # asyncio is only imported when it's used, as it takes longer to import than the rest of the module
+    import asyncio
+
+    try:
+        async for data in source:
+            for i in range(0, len(data), buffer_size):
+                yield data[i:i + buffer_size] if len(data) > buffer_size else data
+                await asyncio.sleep(0)
+    finally:
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def _iter_source(source, buffer_size=65536, memory_map=False):
+    """
+    Read *source* a chunk at a time.
+
+    Binary files are read into a single preallocated buffer, so the yielded chunks
+    are only valid until the next chunk is requested.
+
+    :param source: A filename or file like object containing HTML data.
+    :type source: str or io.BufferedIOBase or io.TextIOBase
+
+    :param int buffer_size: Number of bytes to read from *source* at a time.
+
+    :param bool memory_map: Memory map *source* instead of reading it, if *source* supports it.
+
+    :return: A generator of chunks of data.
+    :rtype: collections.abc.Iterator[str or memoryview]
+    """
+    # Assume that source is a filename if no read methods is found
+    if not hasattr(source, "read"):
+        source = open(source, "rb")
+        close_source = True
+    else:
+        close_source = False
+
+    try:
+        if isinstance(source, io.TextIOBase) or not hasattr(source, "readinto"):
+            while True:
+                data = source.read(buffer_size)
+                if not data:
+                    break
+                yield data
+            return None
+
+        mapped = None
+        if memory_map:
+            try:
+                mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError, io.UnsupportedOperation):
+                # Empty files and file objects without a file descriptor can not be mapped
+                mapped = None
+
+        if mapped is not None:
+            with mapped, memoryview(mapped) as view:
+                for start in range(source.tell(), len(view), buffer_size):
+                    with view[start:start + buffer_size] as data:
+                        yield data
+        else:
+            buffer = bytearray(buffer_size)
+            with memoryview(buffer) as view:
+                while True:
+                    size = source.readinto(buffer)
+                    if not size:
+                        break
+                    with view[:size] as data:
+                        yield data
+    finally:
+        if close_source:
+            source.close()
+
+
+class HTMLement(object):
+    """
+    Python HTMLParser extension with ElementTree Parser support.
+
+    This HTML Parser extends :class:`html.parser.HTMLParser`, returning an :class:`xml.etree.ElementTree.Element`
+    instance. The returned root element natively supports the ElementTree API.
+    (e.g. you may use its limited support for `XPath expressions`__)
+
+    When a "tag" and "tag attributes" are given the parser will search for a required section. Only when the required
+    section is found, does the parser start parsing the "HTML document". The element that matches the search criteria
+    will then become the new "root element". When *multiple* is True, every section that matches the search criteria
+    is parsed, and :meth:`close` will return a list of the "root elements" of these sections.
+
+    Multiple sections can also be parsed in one pass by giving *sections* as a dict of {'name': ('tag', attrs)}.
+    Only these sections are parsed, and parsing stops as soon as all of them have been closed.
+    :meth:`close` will then return a dict of {'name': element}, where sections that were not found are None.
+
+    When a *target* is given, the parser calls its start, end, data and comment methods instead of building an
+    :class:`xml.etree.ElementTree.Element` tree, in the same way as :class:`xml.etree.ElementTree.XMLParser`.
+    :meth:`close` then returns the result of the targets close method, or when searching for sections,
+    what the targets start method returned for the "root elements" of the sections.
+    e.g. :class:`xml.etree.ElementTree.TreeBuilder` with a custom element factory or :class:`lxml.etree.TreeBuilder`.
+
+    Unwanted subtrees can be pruned from the tree, e.g. ``skip_tags={"script", "style", "svg"}``. The elements within
+    a pruned subtree are only tracked to find where the subtree ends, no elements, attributes or text are built for them.
+    With *keep_tags* every element that is not listed is pruned, apart from the "root element" of the tree or section.
+
+    The attributes of the elements can be projected in the same way, e.g. ``attrs_keep={"href", "src", "class", "id"}``.
+    Projections can also be given per tag as a dict of {'tag': names}, where the '*' key applies to all other tags.
+    Tags without a projection keep all of their attributes. Sections are still matched against all attributes.
+
+    To observe the parse without building a tree, give any of the *on_start*, *on_end*, *on_text* and *on_comment*
+    callbacks. They are called in the same order, with the same error recovery and section filtering,
+    as the elements would otherwise be built. :meth:`close` then returns None, or when searching for sections,
+    what *on_start* returned for the "root elements" of the sections.
+    Text may be split over more than one call to *on_text*, e.g. around character references. ::
+
+        links = []
+        parser = htmlement.HTMLement(on_start=lambda tag, attrs: tag == "a" and links.append(attrs.get("href")))
+
+    The *engine* selects the tokenizer. "stdlib" is the tokenizer of :class:`html.parser.HTMLParser`.
+    "fast" matches the common start tags, end tags and comments in bulk with one regular expression,
+    and hands everything else to :class:`html.parser.HTMLParser`, building the same tree in a lot less time.
+
+    The *backend* selects the parser, "stdlib", "lxml" or "html5-parser". The optional parsers are written in C,
+    and tokenize the document and recover from errors in their own way, e.g. lxml adds the implied html and body
+    elements. Their output is fed through the same section search, void handling, pruning and projection,
+    so the result is still an :class:`xml.etree.ElementTree.Element`. "auto" uses the fastest one that is installed.
+
+    Attributes are given as a dict of {'name': 'value'}. Value can be the string to match, `True` or `False.`
+    `True` will match any attribute with given name and any value.
+    `False` will only give a match if given attribute does not exist in the element.
+    See :class:`Filter` for the other supported values. A precompiled :class:`Filter` can also be given as *tag*.
+
+    :param tag: (optional) Name of "tag / element" which is used to filter down "the tree" to a required section.
+    :type tag: str or Filter
+
+    :param attrs: (optional) The attributes of the element, that will be used, when searchingfor the required section.
+    :type attrs: dict(str, str)
+
+    :param encoding: (optional) Encoding used, when decoding the source data before feeding it to the parser.
+    :type encoding: str
+
+    :param transport_encoding: (optional) Encoding given by the transport layer. e.g. HTTP "Content-Type" charset.
+                               Used when *data* is of type :class:`bytes`, has no byte order mark and no encoding
+                               was specified.
+    :type transport_encoding: str
+
+    :param events: (optional) The events to collect for :meth:`read_events`, any of "start", "end" and "comment".
+    :type events: collections.abc.Sequence[str]
+
+    :param bool multiple: (optional) Parse every section that matches the search criteria, not just the first.
+
+    :param sections: (optional) Named sections to parse in one pass, given as {'name': ('tag', attrs)}.
+    :type sections: dict(str, tuple(str, dict(str, str)))
+
+    :param target: (optional) Target object that receives the start, end, data and comment calls.
+
+    :param skip_tags: (optional) Tag names of the elements, that are pruned from the tree along with their content.
+    :type skip_tags: collections.abc.Iterable[str]
+
+    :param keep_tags: (optional) Tag names of the only elements, that are kept in the tree.
+    :type keep_tags: collections.abc.Iterable[str]
+
+    :param bool comments: (optional) Keep the comments of the document. Defaults to True.
+
+    :param attrs_keep: (optional) Names of the only attributes, that are kept, for all tags or per tag.
+    :type attrs_keep: collections.abc.Iterable[str] or dict(str, collections.abc.Iterable[str])
+
+    :param attrs_drop: (optional) Names of the attributes, that are dropped, for all tags or per tag.
+    :type attrs_drop: collections.abc.Iterable[str] or dict(str, collections.abc.Iterable[str])
+
+    :param bool intern_names: (optional) Share the tag and attribute names between all parsed trees, instead of
+                              every tree having its own copies. Defaults to True.
+
+    :param on_start: (optional) Called with the tag and the dict of attributes, when an element is opened.
+    :param on_end: (optional) Called with the tag, when an element is closed.
+    :param on_text: (optional) Called with the text, that is found within the elements.
+    :param on_comment: (optional) Called with the text of the comments, that are found within the elements.
+
+    :param str engine: (optional) The tokenizer to use, "stdlib" or "fast". Defaults to "stdlib".
+
+    :param str backend: (optional) The parser to use, "stdlib", "lxml", "html5-parser" or "auto".
+                        Defaults to "stdlib".
+
+    :raises ValueError: If *sections* are combined with *tag* or *multiple*, *skip_tags* with *keep_tags*,
+                        *attrs_keep* with *attrs_drop* or the callbacks with a *target*,
+                        or if *engine* or *backend* is unknown.
+    :raises ImportError: If the parser of the *backend* is not installed.
+
+    .. _Xpath: https://docs.python.org/3.6/library/xml.etree.elementtree.html#xpath-support
+    __ XPath_
+    """
+    def __init__(self, tag="", attrs=None, encoding=None, transport_encoding=None, events=None, multiple=False,
+                 sections=None, target=None, skip_tags=None, keep_tags=None, comments=True, attrs_keep=None,
+                 attrs_drop=None, intern_names=True, on_start=None, on_end=None, on_text=None, on_comment=None,
+                 engine="stdlib", backend="stdlib"):
+        if on_start or on_end or on_text or on_comment:
+            if target is not None:
+                raise ValueError("callbacks can not be combined with a target")
+            target = _Callbacks(on_start, on_end, on_text, on_comment)
+
+        self._parser = ParseHTML(tag, attrs, events, multiple, sections, target, skip_tags, keep_tags, comments,
+                                 attrs_keep, attrs_drop, intern_names, engine, backend)
+        self.encoding = encoding
+        self.transport_encoding = transport_encoding
+        self._decoder = None
+        self._head = b""
+        self._finished = False
+
+    def feed(self, data):
+        """
+        Feeds data to the parser.
+
+        If *data*, is of type :class:`bytes` and where no encoding was specified, then the encoding
+        will be taken from the "byte order mark", the "transport encoding" or the "meta tags"
+        within the first 1024 bytes of *data*, in that order, if available.
+        Otherwise encoding will default to "ISO-8859-1"
+
+        Bytes are decoded using an incremental decoder, so a multi-byte character that is
+        split across two calls to feed, will be decoded correctly.
+
+        :param data: HTML data
+        :type data: str or bytes or bytearray or memoryview
+
+        :raises UnicodeDecodeError: If decoding of *data* fails.
+        """
+        # Skip feeding data into parser if we already have what we want
+        if self._finished:
+            return None
+
+        # Make sure that we have unicode before continuing
+        if not isinstance(data, str):
+            data = self._decode(data)
+            if not data:
+                return None
+
+        self._feed(data)
+
+    def close(self):
+        """
+        Close the "tree builder" and return the "root element" of the "element tree".
+
+        When parsing multiple sections, a list of the "root elements" of the sections
+        that have not already been returned by :meth:`read_sections` is returned instead.
+        When parsing named sections, a dict of {'name': element} is returned.
+
+        :return: The "root element" of the "element tree".
+        :rtype: xml.etree.ElementTree.Element or list[xml.etree.ElementTree.Element] or dict
+
+        :raises RuntimeError: If no element matching search criteria was found.
+        :raises UnicodeDecodeError: If the data ends with an incomplete multi-byte sequence.
+        """
+        # Flush any partial sequence that is still held by the decoder
+        if (self._decoder is not None or self._head) and not self._finished:
+            data = self._decode(b"", True)
+            if data:
+                self._feed(data)
+
+        return self._parser.close()
+
+    def read_events(self):
+        """
+        Return a generator of the events that have been collected from the data fed to the parser.
+
+        Events are only collected when *events* were given to the parser. Each event is a tuple of
+        (event, elem), and is only returned once.
+
+        :return: A generator of (event, elem) tuples.
+        :rtype: collections.abc.Iterator[tuple[str, xml.etree.ElementTree.Element]]
+        """
+        events = self._parser.events
+        while events:
+            yield events.popleft()
+
+    def read_sections(self):
+        """
+        Return a generator of the sections that have been completed, when parsing multiple sections.
+
+        Each section is only returned once.
+
+        :return: A generator of the "root elements" of the sections.
+        :rtype: collections.abc.Iterator[xml.etree.ElementTree.Element]
+        """
+        sections = self._parser.sections
+        while sections:
+            yield sections.popleft()
+
+    def _feed(self, data):
+        """Feed unicode *data* into the html parser, stopping when the required section is complete."""
+        try:
+            self._parser.feed(data)
+        except EOFError:
+            self._finished = True
+            self._parser.reset()
+
+    def _decode(self, data, final=False):
+        """
+        Convert *data* to type :class:`str`, carrying any incomplete sequence over to the next call.
+
+        :param data: The html document.
+        :type data: bytes or bytearray or memoryview
+
+        :param bool final: True if this is the last of the data.
+
+        :return: HTML data decoded.
+        :rtype: str
+        """
+        decoder = self._decoder
+        if decoder is None:
+            if not self.encoding:
+                # Hold back the data until there is enough to sniff the encoding from
+                data = self._head + data
+                if len(data) < _PRESCAN_SIZE and not final:
+                    self._head = data
+                    return ""
+
+                self._head = b""
+                self.encoding = self._find_encoding(data)
+            decoder = self._decoder = codecs.getincrementaldecoder(self.encoding)()
+        return decoder.decode(data, final)
+
+    def _find_encoding(self, data):
+        """
+        Sniff the encoding of *data*, only ever looking at the first 1024 bytes.
+
+        :param data: The html document.
+        :type data: bytes
+
+        :return: The name of the encoding.
+        :rtype: str
+        """
+        for bom, encoding in _BOMS:
+            if data.startswith(bom):
+                return encoding
+
+        encoding = _lookup_encoding(self.transport_encoding)
+        if encoding:
+            return encoding
+
+        head = data[:_PRESCAN_SIZE]
+        match = _XML_DECL_RE.match(head)
+        if match:
+            encoding = _lookup_encoding(match.group(1), declared=True)
+            if encoding:
+                return encoding
+
+        # Search for the charset attribute within the meta tags
+        for meta in _META_RE.finditer(head):
+            charset = _CHARSET_RE.search(meta.group())
+            if charset:
+                encoding = _lookup_encoding(charset.group(1), declared=True)
+                if encoding:
+                    return encoding
+
+        # Decode the string into unicode using default encoding
+        warn_msg = "Unable to determine encoding, defaulting to iso-8859-1"
+        _warn(warn_msg, UnicodeWarning)
+        return "iso-8859-1"
+
+
+class _Callbacks(object):
+    """Target that passes the calls of the parser on to the callbacks, without building a tree."""
+    def __init__(self, on_start, on_end, on_text, on_comment):
+        self.start = on_start or _ignore
+        self.end = on_end or _ignore
+        self.data = on_text or _ignore
+        # Comments are skipped by the parser, when there is no callback
+        self.comment = on_comment
+
+    def close(self):
+        return None
+
+
+def _ignore(*args):
+    return None
+
+
+def _warn(message, category):
+    """
+    Issue a warning that points at the code that called into this module, however deep within the module it's raised.
+    e.g. from :meth:`HTMLement.feed`, :meth:`HTMLement.close` or :func:`fromstring`.
+    """
+    frame = sys._getframe()
+    stacklevel = 1
+    while frame is not None and frame.f_globals.get("__name__") == __name__:
+        frame = frame.f_back
+        stacklevel += 1
+    warnings.warn(message, category, stacklevel=stacklevel)
+
+
+def _lookup_encoding(label, declared=False):
+    """
+    Return the name of the encoding for *label*, or None if *label* is not a known encoding.
+
+    Documents that declare utf-16 in the markup are decoded as utf-8 since the declaration itself is ascii.
+    Only a *declared* label is overridden, utf-16 given by the transport layer is used as is.
+    """
+    if label:
+        if isinstance(label, bytes):
+            label = label.decode("ascii", "ignore")
+        try:
+            name = codecs.lookup(label.strip()).name
+        except LookupError:
+            return None
+        return "utf-8" if declared and name.startswith("utf-16") else name
+    return None
+
+
+class Filter(object):
+    """
+    Compiled search criteria of a required section, that can be reused by any number of parsers.
+
+    Attributes are given as a dict of {'name': value}, where value can be:
+
+    * A string to match. For the "class" attribute, every whitespace separated class name must be present.
+    * `True` to match any attribute with given name and any value.
+    * `False` to only match if given attribute does not exist in the element.
+    * A compiled regular expression, that is searched for within the attribute value.
+    * A callable that is given the attribute value and returns True on a match.
+
+    The given attributes are copied, so changing them afterwards has no effect on the filter.
+
+    :param str tag: Name of "tag / element" of the required section.
+    :type tag: str
+
+    :param attrs: (optional) The attributes of the element, that will be used, when searchingfor the required section.
+    :type attrs: dict(str, str or bool or re.Pattern or collections.abc.Callable)
+
+    :raises TypeError: If the value of an attribute is not supported.
+    """
+    __slots__ = ("tag", "attrs", "_checks", "_unwanted", "_all")
+
+    def __init__(self, tag, attrs=None):
+        self.tag = tag
+        self.attrs = dict(attrs) if attrs else {}
+        self._checks = {}
+        unwanted = []
+
+        # Compile each attribute into a bit and a predicate, that's given the attribute value
+        for key, value in self.attrs.items():
+            if isinstance(value, int):
+                if not value:
+                    unwanted.append(key)
+                    continue
+                check = _present
+            elif isinstance(value, str):
+                if key == "class":
+                    check = functools.partial(_has_classes, frozenset(value.split()))
+                else:
+                    check = value.__eq__
+            elif hasattr(value, "search"):
+                check = value.search
+            elif callable(value):
+                check = value
+            else:
+                raise TypeError("Unsupported value for attribute '{}': {!r}".format(key, value))
+            self._checks[key] = (1 << len(self._checks), check)
+
+        self._unwanted = frozenset(unwanted)
+        self._all = (1 << len(self._checks)) - 1
+
+    def __repr__(self):
+        return "{}({!r}, {!r})".format(self.__class__.__name__, self.tag, self.attrs)
+
+    def match(self, tag, attrs):
+        """
+        Check if an element matches the search criteria.
+
+        :param str tag: Name of the element.
+
+        :param attrs: The attributes of the element as (name, value) pairs, as given by :class:`html.parser.HTMLParser`.
+        :type attrs: list[tuple[str, str or None]]
+
+        :return: True if the element matches.
+        :rtype: bool
+        """
+        if tag != self.tag:
+            return False
+
+        checks = self._checks
+        unwanted = self._unwanted
+        found = 0
+        for key, value in attrs:
+            # Check for unwanted attrs
+            if key in unwanted:
+                return False
+
+            # Check for wanted attrs
+            check = checks.get(key)
+            if check is not None and check[1](value or ""):
+                found |= check[0]
+
+        # All attributes have been found once all there bits are set
+        return found == self._all
+
+
+def _present(value):
+    """Match any attribute value."""
+    return True
+
+
+def _has_classes(classes, value):
+    """Match a class attribute that contains all of the given class names."""
+    return classes.issubset(value.split())
+
+
+@functools.lru_cache(maxsize=64)
+def _skip_pattern(tags):
+    """
+    Compile the pattern used to scan for the start of a section, while skipping over
+    comments, CDATA sections and raw text elements, which can contain false positives.
+
+    :param tags: The tag names of the sections that are searched for.
+    :type tags: tuple[str]
+
+    :return: The compiled pattern and the maximum length of a partial match at the end of the data.
+    :rtype: tuple[re.Pattern, int]
+    """
+    pattern = r"<(?:(?P<tag>{})(?=[\s/>])|(?P<comment>!--)|(?P<cdata>!\[CDATA\[)|(?P<raw>{})(?=[\s/>]))".format(
+        "|".join(map(re.escape, tags)), "|".join(_RAW_TEXT))
+    return re.compile(pattern, re.IGNORECASE), max(map(len, tags + _RAW_TEXT + ("![CDATA[",))) + 2
+
+
+# noinspection PyAbstractClass
+class ParseHTML(HTMLParser):
+    def __init__(self, tag="", attrs=None, events=None, multiple=False, sections=None, target=None,
+                 skip_tags=None, keep_tags=None, comments=True, attrs_keep=None, attrs_drop=None, intern_names=True,
+                 engine="stdlib", backend="stdlib"):
+        # Initiate HTMLParser
+        HTMLParser.__init__(self)
+        self.convert_charrefs = True
+        self.tag = tag
+        self.attrs = attrs or {}
+
+        if isinstance(tag, Filter):
+            self.tag, self.attrs = tag.tag, tag.attrs
+
+        if sections and (tag or multiple):
+            raise ValueError("sections can not be combined with a tag filter or multiple")
+        if skip_tags is not None and keep_tags is not None:
+            raise ValueError("skip_tags can not be combined with keep_tags")
+        if attrs_keep is not None and attrs_drop is not None:
+            raise ValueError("attrs_keep can not be combined with attrs_drop")
+        if engine not in ("stdlib", "fast"):
+            raise ValueError("unknown engine: '{}'".format(engine))
+        if backend == "auto":
+            backend = _AUTO_BACKEND
+        elif backend not in _BACKENDS:
+            raise ValueError("unknown backend: '{}'".format(backend))
+        elif not _BACKENDS[backend]:
+            raise ImportError("the {} backend is not installed".format(backend))
+
+        if sections:
+            # Named sections are given as a dict of {'name': ('tag', {'attr': 'value'})}, {'name': 'tag'}
+            # or {'name': Filter('tag', {'attr': 'value'})}
+            self.names = tuple(sections)
+            self._pending = [(name, self._make_filter(*([spec] if isinstance(spec, (str, Filter)) else spec)))
+                             for name, spec in sections.items()]
+        elif tag:
+            self.names = None
+            self._pending = [(None, self._make_filter(tag, attrs))]
+        else:
+            self.names = None
+            self._pending = []
+
+        # Filters that are still searching, and the root elements of the sections that are open
+        self._filters = bool(self._pending)
+        self._open = []
+        self.enabled = not self._filters
+        self._suspend = False
+
+        # Completed sections, queued up when parsing multiple sections
+        self.multiple = multiple
+        self.sections = collections.deque()
+        self.results = {}
+
+        # Queue of (event, elem) tuples, only collected for the requested event types
+        self.events = collections.deque()
+        events = frozenset(events or ())
+        self._event_start = "start" in events
+        self._event_end = "end" in events
+        self._event_comment = "comment" in events
+
+        # The tree builder that receives the start, end, data and comment calls
+        # The default tree builder only supports one root element, so a new one is used for each section
+        self._default_target = target is None
+        self._target = self._make_target() if target is None else target
+        self._comment = getattr(self._target, "comment", None) if comments else None
+
+        # Subtrees of unwanted elements are pruned, _pruned is the depth of the open pruned element
+        self._skip_tags = frozenset(skip_tags or ())
+        self._keep_tags = None if keep_tags is None else frozenset(keep_tags)
+        self._pruning = bool(self._skip_tags) or self._keep_tags is not None
+        self._pruned = None
+
+        # Attribute names to keep or drop, as a dict of {'tag': frozenset(names)} where '*' is used for all other tags
+        self._attrs_keep = self._make_projection(attrs_keep)
+        self._attrs_drop = self._make_projection(attrs_drop)
+
+        # Share tag and attribute names with every other tree, through the module level table of names
+        self._intern_names = intern_names
+
+        # The tokenizer, either the one of HTMLParser or the fast one, which feeds the same handlers
+        self._tokenize = ParseHTML._tokenize_fast if engine == "fast" else HTMLParser.goahead
+
+        # The optional parser, that tokenizes the data instead of HTMLParser
+        if backend == "lxml":
+            self._backend = _LxmlBackend(self)
+        elif backend == "html5-parser":
+            self._backend = _Html5Backend(self)
+        else:
+            self._backend = None
+
+        # Tag names of the open elements and the number of open elements for each tag
+        self._stack = []
+        self._opened = {}
+
+        # Without a filter, a html root element is created to protect from badly written sites that either
+        # have no html starting tag or multiple top level elements, unless the document starts with one itself
+        self._started = False
+        self._wrapped = False
+
+    def reset(self):
+        HTMLParser.reset(self)
+        # The rest of the data is discarded, so the backend has nothing left to parse
+        self._backend = None
+
+    def feed(self, data):
+        if self._backend is None:
+            HTMLParser.feed(self, data)
+        else:
+            self._backend.feed(data)
+
+    def goahead(self, end):
+        # Skip over everything that can not be the start of a section
+        if not self.enabled and self._pending and self.cdata_elem is None:
+            if not self._skip(end):
+                return None
+        return self._tokenize(self, end)
+
+    def _tokenize_fast(self, end):
+        """
+        Tokenize the raw data in the same way as :meth:`html.parser.HTMLParser.goahead`, but with the common
+        start tags, end tags and comments matched by one pattern, which is a lot faster on large documents.
+        Everything else is handed to the methods of :class:`html.parser.HTMLParser`.
+        The line numbers and offsets of :meth:`html.parser.HTMLParser.getpos` are not tracked.
+
+        :param bool end: True if this is the last of the data.
+        """
+        rawdata = self.rawdata
+        match_token = _FAST_TOKEN_RE.match
+        find = rawdata.find
+        i = 0
+        n = len(rawdata)
+        while i < n:
+            if self.cdata_elem is None:
+                j = find("<", i)
+                if j < 0:
+                    # Wait for the rest of a character reference, that may be split across two calls to feed
+                    amppos = rawdata.rfind("&", max(i, n - 34))
+                    if amppos >= 0 and not _PARTIAL_REF_RE.search(rawdata, amppos):
+                        break
+                    j = n
+                if i < j:
+                    self.handle_data(unescape(rawdata[i:j]))
+                    i = j
+                    if i == n:
+                        break
+
+                match = match_token(rawdata, i)
+                if match is not None:
+                    k = match.end()
+                    kind = match.lastgroup
+                    if kind == "close":
+                        tag = match.group("start").lower()
+                        if tag in _RAW_TEXT:
+                            # Raw text is left to HTMLParser, which knows how it ends
+                            k = self.parse_starttag(i)
+                        else:
+                            attrs = match.group("attrs")
+                            attrs = [(name.lower(), unescape(double or single or bare) if equals else None)
+                                     for name, equals, double, single, bare in _FAST_ATTR_RE.findall(attrs)]
+                            if match.group("close"):
+                                self.handle_startendtag(tag, attrs)
+                            else:
+                                self.handle_starttag(tag, attrs)
+                    elif kind == "end":
+                        self.handle_endtag(match.group(kind).lower())
+                    else:
+                        self.handle_comment(match.group(kind))
+
+                    if self._suspend:
+                        # A section was closed, so skip straight to the start of the next section
+                        self._suspend = False
+                        k = self._scan(k, False)
+                    i = k
+                    continue
+            else:
+                match = self.interesting.search(rawdata, i)
+                if match is None:
+                    break
+                j = match.start()
+                if i < j:
+                    self.handle_data(rawdata[i:j])
+                    i = j
+
+            # Anything else is tokenized by HTMLParser, in the same way as its own goahead method does
+            startswith = rawdata.startswith
+            if startswith("</", i):
+                k = self.parse_endtag(i)
+            elif startswith("<!--", i):
+                k = self.parse_comment(i)
+            elif startswith("<?", i):
+                k = self.parse_pi(i)
+            elif startswith("<!", i):
+                k = self.parse_html_declaration(i)
+            elif i + 1 < n and rawdata[i + 1].isascii() and rawdata[i + 1].isalpha():
+                k = self.parse_starttag(i)
+            elif i + 1 < n:
+                self.handle_data("<")
+                k = i + 1
+            else:
+                break
+
+            if k < 0:
+                if not end:
+                    break
+                k = rawdata.find(">", i + 1)
+                if k < 0:
+                    k = rawdata.find("<", i + 1)
+                    if k < 0:
+                        k = i + 1
+                else:
+                    k += 1
+                self.handle_data(unescape(rawdata[i:k]) if self.cdata_elem is None else rawdata[i:k])
+            i = k
+
+        if end and i < n and self.cdata_elem is None:
+            self.handle_data(unescape(rawdata[i:n]))
+            i = n
+        self.rawdata = rawdata[i:]
+
+    def parse_starttag(self, i):
+        k = HTMLParser.parse_starttag(self, i)
+        if self._suspend:
+            # A section was closed, so skip straight to the start of the next section
+            self._suspend = False
+            k = self._scan(k, False)
+        return k
+
+    def parse_endtag(self, i):
+        k = HTMLParser.parse_endtag(self, i)
+        if self._suspend:
+            self._suspend = False
+            k = self._scan(k, False)
+        return k
+
+    def handle_starttag(self, tag, attrs):
+        self._handle_starttag(tag, attrs, self_closing=tag in _VOIDS)
+
+    def handle_startendtag(self, tag, attrs):
+        self._handle_starttag(tag, attrs, self_closing=True)
+
+    def _handle_starttag(self, tag, attrs, self_closing=False):
+        _stack = self._stack
+        if self._pruned is not None:
+            # Within a pruned subtree, only the open elements are tracked
+            if not self_closing:
+                _stack.append(tag)
+                self._opened[tag] = self._opened.get(tag, 0) + 1
+            return None
+
+        enabled = self.enabled
+        section = self._search(tag, attrs) if self._pending else None
+
+        # Add tag element to tree if we have no filter or that the filter matches
+        if enabled or section:
+            if not (_stack or self._started or self._filters):
+                self._start_root(tag)
+                # A self closing html element is kept open, so the rest of the document is still within it
+                self_closing = self_closing and self._wrapped
+
+            # Prune unwanted elements, but never the root element of the tree or section
+            if self._pruning and not section and (_stack or self._wrapped) and self._prune(tag):
+                if not self_closing:
+                    self._pruned = len(_stack)
+                    _stack.append(tag)
+                    self._opened[tag] = self._opened.get(tag, 0) + 1
+                return None
+
+            # Convert attrs to dictionary and create the new element
+            target = self._target
+            if self._attrs_keep is not None or self._attrs_drop is not None:
+                attrib = self._project(tag, attrs)
+            elif self._intern_names:
+                attrib = {_intern(k): v or "" for k, v in attrs}
+            else:
+                attrib = {k: v or "" for k, v in attrs}
+            if self._intern_names:
+                tag = _intern(tag)
+            elem = target.start(tag, attrib)
+            if self._event_start:
+                self.events.append(("start", elem))
+
+            # Set this element as the root element of the section when the filter search matches
+            if section:
+                self._pending.remove(section)
+                self._open.append((len(_stack), elem, section))
+                self.enabled = True
+
+            # Only append the element to the list of open elements if it's not a self closing element
+            if self_closing:
+                end_elem = target.end(tag)
+                if self._event_end:
+                    self.events.append(("end", end_elem))
+                if section:
+                    self._end_section()
+            else:
+                _stack.append(tag)
+                self._opened[tag] = self._opened.get(tag, 0) + 1
+
+    def handle_endtag(self, tag):
+        # Only process end tags when we have no filter or that the filter has been matched
+        # Unable to match the tag to an open element, ignoring it
+        _opened = self._opened
+        if self.enabled and _opened.get(tag):
+            _stack = self._stack
+            _open = self._open
+
+            # If the closing tag is not what's actualy expected, then the expected elements were not
+            # properly closed so we must close those before closing what we have now
+            while True:
+                name = _stack.pop()
+                _opened[name] -= 1
+                if self._pruned is not None:
+                    # Elements within a pruned subtree were never started
+                    if len(_stack) == self._pruned:
+                        self._pruned = None
+                else:
+                    self._end(name)
+                    if _open and len(_stack) == _open[-1][0]:
+                        self._end_section()
+                    elif not (_stack or self._wrapped or self._filters):
+                        # The html root element is closed, so there is nothing left to parse
+                        raise EOFError
+                if name == tag:
+                    break
+
+    def handle_data(self, data):
+        if self.enabled and self._pruned is None and data.strip():
+            if not (self._stack or self._started or self._filters):
+                self._start_root(None)
+            self._target.data(data)
+
+    def handle_entityref(self, name):
+        if self.enabled and self._pruned is None:
+            try:
+                name = chr(_CODEPOINTS[name])
+            except KeyError:
+                pass
+            self._target.data(name)
+
+    def handle_charref(self, name):
+        if self.enabled and self._pruned is None:
+            try:
+                if name[0].lower() == "x":
+                    name = chr(int(name[1:], 16))
+                else:
+                    name = chr(int(name))
+            except ValueError:
+                pass
+            self._target.data(name)
+
+    def handle_comment(self, data):
+        data = data.strip()
+        if data and self.enabled and self._pruned is None and self._comment is not None:
+            # Comments before the first element are kept within the html root element, like text is
+            if not (self._stack or self._started or self._filters):
+                self._start_root(None)
+            elem = self._comment(data)
+            if self._event_comment:
+                self.events.append(("comment", elem))
+
+    def close(self):
+        if self._backend is not None:
+            # The backend closes the remaining elements itself, which may finish the parse
+            with contextlib.suppress(EOFError):
+                self._backend.close()
+
+        # Elements that are still open, are closed by the end of the document
+        _stack = self._stack
+        _open = self._open
+        while _stack:
+            name = _stack.pop()
+            self._opened[name] -= 1
+            if self._pruned is not None:
+                if len(_stack) == self._pruned:
+                    self._pruned = None
+            else:
+                self._end(name)
+                if _open and len(_stack) == _open[-1][0]:
+                    self._end_section(final=True)
+
+        if not self._filters:
+            if not self._started:
+                self._start_root(None)
+            if not self._wrapped:
+                return self._target.close()
+
+            # Content before the html element of the document caused the html root element to be created,
+            # the html element of the document is then returned, without that content
+            self._end("html")
+            root = self._target.close()
+            html = root.find("html") if Etree.iselement(root) else None
+            return root if html is None else html
+
+        # The default tree builder of the last section is never used
+        if not self._default_target:
+            self._target.close()
+
+        if self.names is not None:
+            return {name: self.results.get(name) for name in self.names}
+        elif self.multiple and (self.sections or self.results):
+            return list(self.sections)
+        elif not self.results:
+            msg = "Unable to find requested section with tag of '{}' and attributes of {}"
+            raise RuntimeError(msg.format(self.tag, self.attrs))
+        else:
+            return self.results[None]
+
+    def _start_root(self, tag):
+        """Called when the first element is started without a filter, creates the html root element if required."""
+        self._started = True
+        if tag != "html":
+            self._wrapped = True
+            elem = self._target.start("html", {})
+            if self._event_start:
+                self.events.append(("start", elem))
+
+    def _prune(self, tag):
+        """Check if the element with the given tag, should be pruned from the tree along with its content."""
+        if self._keep_tags is None:
+            return tag in self._skip_tags
+        return tag not in self._keep_tags
+
+    def _project(self, tag, attrs):
+        """Convert attrs to a dictionary, with only the attributes that are wanted for the given tag."""
+        # str returns the name itself, when names are not interned
+        key = _intern if self._intern_names else str
+        if self._attrs_keep is not None:
+            names = self._attrs_keep.get(tag, self._attrs_keep.get("*"))
+            if names is not None:
+                return {key(k): v or "" for k, v in attrs if k in names}
+        else:
+            names = self._attrs_drop.get(tag, self._attrs_drop.get("*"))
+            if names is not None:
+                return {key(k): v or "" for k, v in attrs if k not in names}
+        return {key(k): v or "" for k, v in attrs}
+
+    def _end(self, tag):
+        """Close the last open element, which has the given tag."""
+        elem = self._target.end(tag)
+        if self._event_end:
+            self.events.append(("end", elem))
+
+    def _end_section(self, final=False):
+        """Called when the root element of a section is closed."""
+        _, elem, section = self._open.pop()
+        self.results[section[0]] = elem
+        if self.multiple:
+            # Go back to searching for the next section
+            self.sections.append(elem)
+            self._pending.append(section)
+
+        if not self._open:
+            self.enabled = False
+            if self._default_target:
+                self._target = self._make_target()
+
+            # Stop parsing once every section has been found
+            if not (self._pending or final):
+                raise EOFError
+            self._suspend = True
+
+    def _skip(self, end):
+        """
+        Scan the raw data for the start of a section, without tokenizing anything else.
+
+        :param bool end: True if this is the last of the data.
+
+        :return: True if a section was found, or a raw text element is never closed, and tokenizing should continue.
+        :rtype: bool
+        """
+        self.rawdata = self.rawdata[self._scan(0, end):]
+        return self.enabled or self.cdata_elem is not None
+
+    def _scan(self, i, end):
+        """
+        Scan the raw data from position *i* for the start of a section, the start tag of the section is parsed.
+
+        The scan is also used to return to searching, from within :meth:`html.parser.HTMLParser.goahead`
+        once a section is closed. So the raw data is never copied, the position to continue from is returned instead.
+
+        :param int i: The position to start scanning from.
+        :param bool end: True if this is the last of the data.
+
+        :return: The position after the start tag of the section, or of a raw text element that is never closed.
+                 Or if no section was found, the position of what may be the start of a tag,
+                 that is split across two calls to feed.
+        :rtype: int
+        """
+        rawdata = self.rawdata
+        pattern, partial = _skip_pattern(tuple(sorted({section[1].tag for section in self._pending})))
+        while True:
+            match = pattern.search(rawdata, i)
+            if match is None:
+                # Keep what may be the start of a tag, that is split across two calls to feed
+                j = rawdata.rfind("<", max(i, len(rawdata) - partial))
+                return len(rawdata) if end or j < 0 else j
+
+            i = match.start()
+            kind = match.lastgroup
+            if kind == "tag" or kind == "raw":
+                k = HTMLParser.parse_starttag(self, i)
+                if k < 0:
+                    break
+
+                # A section that only consists of a void element is already closed
+                self._suspend = False
+                i = k
+                if self.enabled:
+                    return i
+                elif self.cdata_elem is None:
+                    # Not a raw text element, or a self closing one, which has no raw text
+                    continue
+
+                # A raw text element, or the matching tag was one but the attributes did not match
+                k = self._find_end(_RAW_TEXT_END[self.cdata_elem], rawdata, i)
+                if k < 0 and end:
+                    # The raw text element is never closed, so the rest of the data is left to the tokenizer
+                    return i
+                self.clear_cdata_mode()
+                if k < 0:
+                    i = match.start()
+            elif kind == "comment":
+                k = rawdata.find("-->", match.end())
+                k = k + 3 if k >= 0 else k
+            else:
+                k = rawdata.find("]]>", match.end())
+                k = k + 3 if k >= 0 else k
+
+            if k < 0:
+                break
+            i = k
+
+        # Wait for the rest of the data, unless this is the end of the data
+        return len(rawdata) if end else i
+
+    @staticmethod
+    def _find_end(pattern, rawdata, i):
+        match = pattern.search(rawdata, i)
+        return match.end() if match else -1
+
+    @staticmethod
+    def _make_target():
+        return Etree.TreeBuilder(insert_comments=True)
+
+    @staticmethod
+    def _make_projection(names):
+        if names is None:
+            return None
+        elif isinstance(names, dict):
+            return {tag: frozenset(tag_names) for tag, tag_names in names.items()}
+        else:
+            return {"*": frozenset(names)}
+
+    @staticmethod
+    def _make_filter(tag, attrs=None):
+        if isinstance(tag, Filter):
+            if attrs:
+                raise ValueError("attrs can not be given together with a Filter")
+            return tag
+        return Filter(tag, attrs)
+
+    def _search(self, tag, attrs):
+        for section in self._pending:
+            if section[1].match(tag, attrs):
+                return section
+
+        # Unable to find required section
+        return None
+
+
+class _BackendTarget(object):
+    """Target of an optional parser, that passes its calls on to the handlers of :class:`ParseHTML`."""
+    def __init__(self, parser):
+        self._parser = parser
+        self.end = parser.handle_endtag
+        self.data = parser.handle_data
+        self.comment = parser.handle_comment
+
+    def start(self, tag, attrib):
+        # Void elements are closed by handle_starttag, so their end tags are ignored
+        self._parser.handle_starttag(tag, list(attrib.items()))
+
+    def close(self):
+        return None
+
+
+class _LxmlBackend(object):
+    """Parse the data incrementally with the html parser of lxml."""
+    def __init__(self, parser):
+        self._parser = _lxml.HTMLParser(target=_BackendTarget(parser), no_network=True)
+        self._fed = False
+
+    def feed(self, data):
+        self._fed = True
+        self._parser.feed(data)
+
+    def close(self):
+        # lxml fails on a document without any data
+        if self._fed:
+            self._parser.close()
+
+
+class _Html5Backend(object):
+    """Parse the data with html5-parser, which only parses whole documents, then replay the tree as target calls."""
+    def __init__(self, parser):
+        self._target = _BackendTarget(parser)
+        self._data = []
+
+    def feed(self, data):
+        self._data.append(data)
+
+    def close(self):
+        if self._data:
+            _replay(_html5_parser.parse("".join(self._data)), self._target)
+
+
+def _replay(root, target):
+    """
+    Call the start, end, data and comment methods of *target*, for every node of a :mod:`lxml.etree` tree.
+
+    :param root: The root element of the tree.
+    :param target: The target that receives the calls.
+    """
+    # Stack of (element, children) that are being walked, using a stack to support deeply nested documents
+    stack = [(None, iter((root,)))]
+    while stack:
+        parent, children = stack[-1]
+        elem = next(children, None)
+        if elem is None:
+            stack.pop()
+            if parent is not None:
+                target.end(parent.tag)
+                if parent.tail:
+                    target.data(parent.tail)
+        elif isinstance(elem.tag, str):
+            target.start(elem.tag, elem.attrib)
+            if elem.text:
+                target.data(elem.text)
+            stack.append((elem, iter(elem)))
+        else:
+            # Processing instructions and entities are skipped, like HTMLParser does
+            if elem.tag is _lxml.Comment:
+                target.comment(elem.text or "")
+            if elem.tail:
+                target.data(elem.tail)
+
+
+class CompactTreeBuilder(object):
+    """
+    Tree builder target that stores the element tree in a compact form, using a fraction of the memory
+    of an :class:`xml.etree.ElementTree.Element` tree.
+
+    Tag and attribute names are stored once as ids, the structure of the tree is stored in arrays of
+    integers and the attributes of all elements are stored in one flat list. The elements are returned as
+    :class:`CompactElement` instances, which support the read only part of the ElementTree API.
+
+    >>> root = htmlement.fromstring(html, target=htmlement.CompactTreeBuilder())
+    """
+    def __init__(self):
+        self._tree = tree = _CompactTree()
+        self._ids = tree.ids
+        self._names = tree.names
+        self._data = []  # data collector
+        self._stack = []  # index of the open elements
+        self._last = -1  # index of the last element, that is given the text or tail
+        self._tail = 0
+        self._root = None
+
+    def start(self, tag, attrs):
+        self._flush()
+        tree = self._tree
+        index = len(tree.tags)
+        tree.tags.append(self._id(tag))
+        tree.text.append(None)
+        tree.tail.append(None)
+        tree.end.append(0)
+        tree.next.append(-1)
+        tree.first.append(-1)
+
+        # Link the element to the last child of its parent
+        if self._stack:
+            parent = self._stack[-1]
+            tree.parent.append(parent)
+            last = self._last if self._tail else -1
+            if last >= 0 and tree.parent[last] == parent:
+                tree.next[last] = index
+            else:
+                tree.first[parent] = index
+        else:
+            tree.parent.append(-1)
+
+        # Attributes are stored in flat lists, with the offset of each element's attributes
+        if attrs:
+            _id = self._id
+            for key, value in attrs.items():
+                tree.attr_names.append(_id(key))
+                tree.attr_values.append(value)
+        tree.attrs.append(len(tree.attr_names))
+
+        self._stack.append(index)
+        self._last = index
+        self._tail = 0
+        elem = CompactElement(tree, index)
+        if self._root is None:
+            self._root = elem
+        return elem
+
+    def end(self, tag):
+        self._flush()
+        index = self._stack.pop()
+        self._tree.end[index] = len(self._tree.tags)
+        self._last = index
+        self._tail = 1
+        return CompactElement(self._tree, index)
+
+    def data(self, data):
+        self._data.append(data)
+
+    def comment(self, text):
+        # Comments are stored as elements without attributes
+        elem = self.start(Etree.Comment, None)
+        self._tree.text[elem.index] = text
+        return self.end(Etree.Comment)
+
+    def close(self):
+        """
+        Flush the builder buffers, and return the root element.
+
+        :return: The root element of the tree.
+        :rtype: CompactElement
+        """
+        self._flush()
+        return self._root
+
+    def _id(self, name):
+        ids = self._ids
+        try:
+            return ids[name]
+        except KeyError:
+            ids[name] = len(self._names)
+            self._names.append(name)
+            return ids[name]
+
+    def _flush(self):
+        if self._data:
+            if self._last >= 0:
+                text = "".join(self._data)
+                if self._tail:
+                    self._tree.tail[self._last] = text
+                else:
+                    self._tree.text[self._last] = text
+            self._data = []
+
+
+class _CompactTree(object):
+    """Storage of a compact element tree. Elements are stored in document order."""
+    __slots__ = ("ids", "names", "tags", "parent", "first", "next", "end", "text", "tail",
+                 "attrs", "attr_names", "attr_values", "cache", "lock", "__weakref__")
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.tags = array.array("I")
+        self.parent = array.array("i")
+        self.first = array.array("i")  # index of the first child
+        self.next = array.array("i")  # index of the next sibling
+        self.end = array.array("I")  # index after the last descendant
+        self.text = []
+        self.tail = []
+        self.attrs = array.array("I", [0])  # offset of the attributes of each element
+        self.attr_names = array.array("I")
+        self.attr_values = []
+        self.cache = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+
+    def element(self, index):
+        # The same element object is returned while it's in use, the ElementPath module depends on this
+        elem = self.cache.get(index)
+        if elem is None:
+            # The tree can be read by many threads, so only one of them creates the element
+            with self.lock:
+                elem = self.cache.get(index)
+                if elem is None:
+                    elem = self.cache[index] = CompactElement(self, index)
+        return elem
+
+
+class CompactElement(object):
+    """
+    Read only view of an element of a compact element tree, that supports the ElementTree API.
+    Only the element tree and the position of the element are stored, everything else is looked up on demand.
+
+    Changing the :attr:`attrib` dict has no effect on the element.
+    """
+    __slots__ = ("_tree", "index", "__weakref__")
+
+    def __init__(self, tree, index):
+        self._tree = tree
+        self.index = index
+
+    def __repr__(self):
+        return "<{} {!r} at {:#x}>".format(self.__class__.__name__, self.tag, id(self))
+
+    def __eq__(self, other):
+        if isinstance(other, CompactElement):
+            return self._tree is other._tree and self.index == other.index
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self._tree), self.index))
+
+    def __len__(self):
+        return sum(1 for _ in self._children())
+
+    def __bool__(self):
+        # Same as Element, where an element is always true, even if it has no children
+        return True
+
+    def __iter__(self):
+        element = self._tree.element
+        return (element(index) for index in self._children())
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    @property
+    def tag(self):
+        tree = self._tree
+        return tree.names[tree.tags[self.index]]
+
+    @property
+    def text(self):
+        return self._tree.text[self.index]
+
+    @property
+    def tail(self):
+        return self._tree.tail[self.index]
+
+    @property
+    def attrib(self):
+        return dict(self.items())
+
+    def get(self, key, default=None):
+        tree = self._tree
+        key = tree.ids.get(key)
+        for pos in range(tree.attrs[self.index], tree.attrs[self.index + 1]):
+            if tree.attr_names[pos] == key:
+                return tree.attr_values[pos]
+        return default
+
+    def keys(self):
+        return [key for key, _ in self.items()]
+
+    def items(self):
+        tree = self._tree
+        start, end = tree.attrs[self.index], tree.attrs[self.index + 1]
+        names = tree.names
+        return [(names[key], value) for key, value in zip(tree.attr_names[start:end], tree.attr_values[start:end])]
+
+    def iter(self, tag=None):
+        # Elements are stored in document order, so all descendants directly follow the element
+        tree = self._tree
+        element = tree.element
+        start, end = self.index + 1, tree.end[self.index]
+        if tag is None or tag == "*":
+            yield self
+            for index in range(start, end):
+                yield element(index)
+        else:
+            tag_id = tree.ids.get(tag)
+            tags = tree.tags
+            if tags[self.index] == tag_id:
+                yield self
+            for index in range(start, end):
+                if tags[index] == tag_id:
+                    yield element(index)
+
+    def itertext(self):
+        if self.text:
+            yield self.text
+        for child in self:
+            for text in child.itertext():
+                yield text
+            if child.tail:
+                yield child.tail
+
+    def find(self, path, namespaces=None):
+        return ElementPath.find(self, path, namespaces)
+
+    def findall(self, path, namespaces=None):
+        return ElementPath.findall(self, path, namespaces)
+
+    def iterfind(self, path, namespaces=None):
+        return ElementPath.iterfind(self, path, namespaces)
+
+    def findtext(self, path, default=None, namespaces=None):
+        return ElementPath.findtext(self, path, default, namespaces)
+
+    def _children(self):
+        _next = self._tree.next
+        index = self._tree.first[self.index]
+        while index >= 0:
+            yield index
+            index = _next[index]
+
+
+class IndexBuilder(object):
+    """
+    Tree builder target that indexes the elements by id, class and tag while they are built,
+    so that repeated lookups do not need to walk the whole element tree.
+
+    The elements are built by the wrapped *target*, and the index is queried from the builder itself. ::
+
+        index = htmlement.IndexBuilder()
+        root = htmlement.fromstring(html, target=index)
+        elem = index.get_element_by_id("main")
+
+    :param target: (optional) Target object that builds the elements. Defaults to a
+                   :class:`xml.etree.ElementTree.TreeBuilder`, with a new one for every section.
+    """
+    def __init__(self, target=None):
+        self._default_target = target is None
+        self.target = ParseHTML._make_target() if target is None else target
+        self._ids = {}
+        self._classes = {}
+        self._tags = {}
+        self._parents = {}
+        self._stack = []  # the open elements
+        self._started = False
+
+        # Comments are only supported if the target supports them
+        if not hasattr(self.target, "comment"):
+            self.comment = None
+
+    def start(self, tag, attrs):
+        _stack = self._stack
+        if not _stack:
+            # The default tree builder only supports one root element
+            if self._started and self._default_target:
+                self.target = ParseHTML._make_target()
+            self._started = True
+
+        elem = self.target.start(tag, attrs)
+        self._parents[elem] = _stack[-1] if _stack else None
+        _stack.append(elem)
+
+        # The first element with a given id wins, the same as with getElementById
+        if "id" in attrs:
+            self._ids.setdefault(attrs["id"], elem)
+        if "class" in attrs:
+            for name in attrs["class"].split():
+                self._classes.setdefault(name, []).append(elem)
+        self._tags.setdefault(tag, []).append(elem)
+        return elem
+
+    def end(self, tag):
+        self._stack.pop()
+        return self.target.end(tag)
+
+    def data(self, data):
+        self.target.data(data)
+
+    def comment(self, text):
+        return self.target.comment(text)
+
+    def close(self):
+        """
+        Close the wrapped target, and return what it returns.
+
+        :return: The root element of the tree.
+        """
+        return self.target.close()
+
+    def get_element_by_id(self, id, default=None):
+        """
+        Find the element with the given id.
+
+        :param str id: The id of the element.
+        :param default: (optional) Returned when no element has the given id.
+
+        :return: The first element with the given id, or *default*.
+        """
+        return self._ids.get(id, default)
+
+    def iter_by_class(self, name):
+        """
+        Iterate over the elements that have the given class name, in document order.
+
+        :param str name: A single class name.
+
+        :return: An iterator of the matching elements.
+        """
+        return iter(self._classes.get(name, ()))
+
+    def iter_by_tag(self, tag):
+        """
+        Iterate over the elements with the given tag name, in document order.
+
+        :param str tag: Name of the elements.
+
+        :return: An iterator of the matching elements.
+        """
+        return iter(self._tags.get(tag, ()))
+
+    def getparent(self, elem):
+        """
+        Return the parent of an element, or None if the element is a root element.
+
+        :param elem: An element that was built by this builder.
+
+        :return: The parent element.
+
+        :raises KeyError: If *elem* was not built by this builder.
+        """
+        return self._parents[elem]
+
+
+class QuerySet(object):
+    """
+    A set of ElementPath queries, that are all evaluated in one traversal of the element tree.
+
+    Each query is compiled once per process into steps. While the tree is traversed in document order, every element
+    is only checked against the steps that have its tag, and a step only matches if the step before it was matched
+    by the parent or an ancestor. So the cost of evaluating the set scales with the size of the tree, rather than the
+    size of the tree times the number of queries. Every matching element is returned once, in document order.
+
+    The supported subset is the tag, ``*``, ``/`` and ``//`` steps, with ``[@attr]``, ``[@attr='value']``,
+    ``[tag]``, ``[tag='text']``, ``[.='text']``, ``[index]`` and ``[last()]`` predicates.
+    Any other expression, e.g. one with a ``..`` step, is evaluated separately using :meth:`findall`. ::
+
+        queries = htmlement.QuerySet({"title": ".//h1", "links": ".//a[@href]"})
+        results = queries.findall(root)
+
+    :param queries: The queries, given as a dict of {'name': 'path'} or a sequence of paths.
+    :type queries: dict(str, str) or collections.abc.Iterable[str]
+    """
+    def __init__(self, queries):
+        if not isinstance(queries, dict):
+            queries = {path: path for path in queries}
+        self.queries = queries
+
+        # The steps of all queries as (name, step, last, descendant, predicates), grouped by tag
+        # Steps that start with an [@attr='value'] predicate are also grouped by the attribute and value,
+        # so they are found with one lookup. Queries that are not supported are evaluated one at a time.
+        by_tag = {}
+        self._self = []
+        self._other = []
+        self._positional = False
+        for name, path in queries.items():
+            steps = _compile_query(path)
+            if steps is None:
+                self._other.append((name, path))
+            elif not steps:
+                self._self.append(name)
+            else:
+                for k, (descendant, tag, predicates) in enumerate(steps):
+                    plain, keyed = by_tag.setdefault(tag, ([], {}))
+                    last = k == len(steps) - 1
+                    if predicates and predicates[0].func is _attr_equals:
+                        key, value = predicates[0].args
+                        keyed.setdefault(key, {}).setdefault(value, []).append(
+                            (name, k, last, descendant, predicates[1:]))
+                    else:
+                        plain.append((name, k, last, descendant, predicates))
+                    self._positional |= any(predicate.func is _position for predicate in predicates)
+
+        # Queries can be matched while the tree is being built, if they only depend on the ancestors of the element
+        streamable = (_attr_exists, _attr_equals, _attr_differs)
+        self._streamable = not self._other and all(
+            predicate.args[0] >= 0 if predicate.func is _position else predicate.func in streamable
+            for name, path in queries.items() for step in (_compile_query(path) or ()) for predicate in step[2])
+
+        # Steps with a wildcard tag are checked for every element
+        self._any = by_tag.pop(None, ([], {}))
+        self._by_tag = {tag: self._merge(steps, self._any) for tag, steps in by_tag.items()}
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.queries)
+
+    def findall(self, elem):
+        """
+        Find all the elements that match each query.
+
+        :param elem: The element to search from, e.g. the root element.
+        :type elem: xml.etree.ElementTree.Element or CompactElement
+
+        :return: A dict of {'name': [elements]}, with the names in the same order as the queries.
+        :rtype: dict(str, list)
+
+        :raises SyntaxError: If a query is not a valid ElementPath expression.
+        """
+        results = {name: [] for name in self.queries}
+        for name in self._self:
+            results[name].append(elem)
+        if self._by_tag or self._any[0] or self._any[1]:
+            self._walk(elem, results)
+        for name, path in self._other:
+            results[name] = elem.findall(path)
+        return results
+
+    def find(self, elem):
+        """
+        Find the first element that matches each query.
+
+        :param elem: The element to search from, e.g. the root element.
+        :type elem: xml.etree.ElementTree.Element or CompactElement
+
+        :return: A dict of {'name': element}, where the element is None if there was no match.
+        :rtype: dict(str, object)
+
+        :raises SyntaxError: If a query is not a valid ElementPath expression.
+        """
+        return {name: found[0] if found else None for name, found in self.findall(elem).items()}
+
+    def _walk(self, root, results):
+        empty = frozenset()
+
+        # Each level holds the children of an element, the steps matched by the element,
+        # the steps matched by the element or any of its ancestors and the positions of the children
+        stack = [(iter(root), empty, empty, self._positions(root))]
+        while stack:
+            children, matched, inherited, positions = stack[-1]
+            for child in children:
+                tag = child.tag
+                if positions is not None and isinstance(tag, str):
+                    index = positions[1].get(tag, 0)
+                    positions[1][tag] = index + 1
+                    total = positions[0][tag]
+                else:
+                    # Comments do not have a position
+                    index = total = None
+
+                names, found = self._match(child, tag, index, total, matched, inherited, len(stack) == 1)
+                for name in names:
+                    results[name].append(child)
+
+                if len(child):
+                    if found is None:
+                        stack.append((iter(child), empty, inherited, self._positions(child)))
+                    else:
+                        found = frozenset(found)
+                        stack.append((iter(child), found, inherited | found, self._positions(child)))
+                    break
+            else:
+                stack.pop()
+
+    @staticmethod
+    def _merge(steps, other):
+        plain = steps[0] + other[0]
+        keyed = {key: dict(values) for key, values in steps[1].items()}
+        for key, values in other[1].items():
+            merged = keyed.setdefault(key, {})
+            for value, matches in values.items():
+                merged[value] = merged.get(value, []) + matches
+        return plain, keyed
+
+    def _match(self, elem, tag, index, total, matched, inherited, top):
+        """
+        Match an element against the steps of the queries, given the steps that were matched by its ancestors.
+
+        :param elem: The element, or the attributes of the element.
+        :param str tag: The tag of the element.
+        :param int index: The index of the element among the siblings with the same tag.
+        :param int total: The number of siblings with the same tag.
+        :param frozenset matched: The (name, step) pairs that were matched by the parent.
+        :param frozenset inherited: The (name, step) pairs that were matched by the parent or any of its ancestors.
+        :param bool top: True if the parent is the context element.
+
+        :return: The names of the queries that are matched by the element,
+                 and the (name, step) pairs that were matched by the element, that are not the last step of the query.
+        :rtype: tuple[list[str], list[tuple[str, int]] or None]
+        """
+        steps, keyed = self._by_tag.get(tag, self._any)
+        for key, values in keyed.items():
+            matches = values.get(elem.get(key))
+            if matches is not None:
+                steps = steps + matches
+
+        names = []
+        found = None
+        for name, k, last, descendant, predicates in steps:
+            if k:
+                if (name, k - 1) not in (inherited if descendant else matched):
+                    continue
+            elif not (descendant or top):
+                continue
+            if predicates and not all(predicate(elem, index, total) for predicate in predicates):
+                continue
+
+            if last:
+                names.append(name)
+            elif found is None:
+                found = [(name, k)]
+            else:
+                found.append((name, k))
+        return names, found
+
+    def _positions(self, elem):
+        # The number of children with each tag, and the number of children of each tag seen so far
+        if self._positional:
+            return collections.Counter(child.tag for child in elem), {}
+        return None
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_query(path):
+    """
+    Compile an ElementPath expression into steps, that can be matched against the ancestors of an element.
+
+    :param str path: The ElementPath expression.
+
+    :return: The (descendant, tag, predicates) steps, where tag is None for ``*``,
+             or None if the expression is not supported.
+    :rtype: tuple[tuple[bool, str, tuple]] or None
+    """
+    tokens = list(ElementPath.xpath_tokenizer(path))
+    descendant = False
+    steps = []
+    i = 0
+
+    # Relative paths can start with the context element
+    if tokens[:1] == [(".", "")]:
+        if len(tokens) == 1:
+            return ()
+        elif tokens[1][0] not in ("/", "//"):
+            return None
+        descendant = tokens[1][0] == "//"
+        i = 2
+
+    while i < len(tokens):
+        op, tag = tokens[i]
+        if op == "*":
+            tag = None
+        elif op or not tag or tag[:1] == "{":
+            return None
+        i += 1
+
+        predicates = []
+        while i < len(tokens) and tokens[i][0] == "[":
+            try:
+                j = tokens.index(("]", ""), i)
+            except ValueError:
+                return None
+            predicate = _compile_predicate(tokens[i + 1:j])
+            if predicate is None:
+                return None
+            predicates.append(predicate)
+            i = j + 1
+
+        steps.append((descendant, tag, tuple(predicates)))
+        if i == len(tokens):
+            return tuple(steps)
+        elif tokens[i][0] not in ("/", "//"):
+            return None
+        descendant = tokens[i][0] == "//"
+        i += 1
+
+    # The path is empty or ends with a separator
+    return None
+
+
+def _compile_predicate(tokens):
+    """
+    Compile the tokens of a predicate, in the same way as :mod:`xml.etree.ElementPath`.
+
+    :return: A function that is called with the element, its index among the siblings with the same tag and the
+             number of those siblings, or None if the predicate is not supported.
+    """
+    signature = []
+    values = []
+    for op, tag in tokens:
+        if (op, tag) == ("", ""):
+            continue
+        if op and op[:1] in "'\"":
+            op, tag = "'", op[1:-1]
+        signature.append(op or "-")
+        values.append(tag)
+
+    signature = "".join(signature)
+    numeric = bool(values) and re.match(r"-?\d+$", values[0]) is not None
+    if signature == "@-":
+        return functools.partial(_attr_exists, values[1])
+    elif signature in ("@-='", "@-!='"):
+        return functools.partial(_attr_differs if "!=" in signature else _attr_equals, values[1], values[-1])
+    elif signature == "-" and not numeric:
+        return functools.partial(_has_child, values[0])
+    elif signature in (".='", ".!='") or (signature in ("-='", "-!='") and not numeric):
+        return functools.partial(_text_equals, values[0], values[-1], "!=" in signature)
+    elif signature == "-" and int(values[0]) >= 1:
+        return functools.partial(_position, int(values[0]) - 1)
+    elif signature == "-()" and values[0] == "last":
+        return functools.partial(_position, -1)
+    elif signature == "-()-" and values[0] == "last" and values[2].lstrip("-").isdigit() and int(values[2]) < 0:
+        return functools.partial(_position, int(values[2]) - 1)
+    return None
+
+
+def _attr_exists(key, elem, index, total):
+    return elem.get(key) is not None
+
+
+def _attr_equals(key, value, elem, index, total):
+    return elem.get(key) == value
+
+
+def _attr_differs(key, value, elem, index, total):
+    attr_value = elem.get(key)
+    return attr_value is not None and attr_value != value
+
+
+def _has_child(tag, elem, index, total):
+    return elem.find(tag) is not None
+
+
+def _text_equals(tag, value, negated, elem, index, total):
+    for child in (elem.iterfind(tag) if tag else (elem,)):
+        if ("".join(child.itertext()) == value) != negated:
+            return True
+    return False
+
+
+def _position(position, elem, index, total):
+    # The index is counted among the siblings with the same tag, which comments do not have
+    return index is not None and index == (position if position >= 0 else total + position)
+
+
+_EMPTY = frozenset()
+
+
+class _RecordBuilder(object):
+    """
+    Tree builder target that extracts the fields of the records, which are the sections that are parsed.
+
+    The start method returns the dict of fields for the root element of each record, which is filled in
+    by the time the record is closed. Comments are not supported, so they are never part of the text.
+    """
+    def __init__(self, fields):
+        # The attribute to extract is split off from the path of each field
+        paths = {}
+        self._attributes = {}
+        for name, path in fields.items():
+            if path.startswith("@"):
+                path, self._attributes[name] = ".", path[1:]
+            elif "/@" in path:
+                path, self._attributes[name] = path.rsplit("/@", 1)
+            paths[name] = path
+
+        self._queries = QuerySet(paths)
+        self._record = None
+        self._stack = []  # (matched, inherited, tag counts) of the open elements
+        self._captures = []  # [name, depth, text] of the fields with text that is still being collected
+        self._done = set()  # the fields that have been found
+        self._builder = None
+
+    def start(self, tag, attrs):
+        _stack = self._stack
+        queries = self._queries
+        if not _stack:
+            # The root element of a new record
+            self._record = dict.fromkeys(queries.queries)
+            self._done = set()
+            if not queries._streamable:
+                self._builder = ParseHTML._make_target()
+            else:
+                for name in queries._self:
+                    self._found(name, attrs)
+            _stack.append((_EMPTY, _EMPTY, {}))
+            if self._builder is not None:
+                self._builder.start(tag, attrs)
+            return self._record
+
+        if self._builder is not None:
+            _stack.append(None)
+            self._builder.start(tag, attrs)
+            return None
+
+        matched, inherited, counts = _stack[-1]
+        index = counts.get(tag, 0)
+        counts[tag] = index + 1
+
+        names, found = queries._match(attrs, tag, index, None, matched, inherited, len(_stack) == 1)
+        for name in names:
+            if name not in self._done:
+                self._found(name, attrs)
+
+        if found is None:
+            _stack.append((_EMPTY, inherited, {}))
+        else:
+            found = frozenset(found)
+            _stack.append((found, inherited | found, {}))
+        return None
+
+    def end(self, tag):
+        self._stack.pop()
+        depth = len(self._stack)
+        _captures = self._captures
+        while _captures and _captures[-1][1] == depth:
+            name, _, text = _captures.pop()
+            self._record[name] = "".join(text).strip()
+
+        if self._builder is not None:
+            self._builder.end(tag)
+            if not depth:
+                self._extract(self._builder.close())
+                self._builder = None
+
+        return self._record if not depth else None
+
+    def data(self, data):
+        for capture in self._captures:
+            capture[2].append(data)
+        if self._builder is not None:
+            self._builder.data(data)
+
+    def close(self):
+        return None
+
+    def _found(self, name, attrs):
+        """Called with the attributes of the first element that matches a field, when streaming."""
+        self._done.add(name)
+        if name in self._attributes:
+            self._record[name] = attrs.get(self._attributes[name])
+        else:
+            self._captures.append([name, len(self._stack), []])
+
+    def _extract(self, root):
+        """Extract the fields from the root element of a record, when not streaming."""
+        record = self._record
+        for name, elem in self._queries.find(root).items():
+            if elem is None:
+                record[name] = None
+            elif name in self._attributes:
+                record[name] = elem.get(self._attributes[name])
+            else:
+                record[name] = "".join(elem.itertext()).strip()
+
+
+class ParseCache(object):
+    """
+    Cache of parsed element trees, for pages that are fetched again without having changed.
+
+    Trees are keyed on a hash of the html data, together with the search criteria and the other parse options,
+    and are stored pickled. So every hit returns a fresh copy of the tree, which the caller can change
+    without affecting the cache. The least recently used trees are evicted once the pickled trees
+    take up more than *max_bytes*. When a *directory* is given, every tree is also written to it,
+    so the cache is kept between runs and can be shared by processes. The directory is never evicted,
+    and since trees are unpickled from it, it has to be trusted. ::
+
+        cache = htmlement.ParseCache(max_bytes=256 * 1024 * 1024)
+        root = cache.fromstring(page, "div", {"id": "content"})
+        print(cache.hits, cache.misses)
+
+    Only options that can be part of the key are supported, e.g. no *target*, callbacks or callable attribute values.
+
+    :param int max_bytes: (optional) Maximum size of the pickled trees that are kept in memory. Defaults to 64MB.
+
+    :param str directory: (optional) Directory where the pickled trees are kept as well.
+
+    :ivar int hits: Number of trees that were returned from the cache.
+    :ivar int misses: Number of trees that had to be parsed.
+    """
+    def __init__(self, max_bytes=67108864, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def fromstring(self, text, tag="", attrs=None, encoding=None, transport_encoding=None, sections=None, **options):
+        """
+        Parse "HTML" document from a string into an element tree, in the same way as :func:`fromstring`,
+        returning a copy of the cached tree when the same document was parsed before with the same parameters.
+
+        :param text: The "HTML" document to parse.
+        :type text: str or bytes
+
+        :param options: (optional) Extra keyword arguments that are passed on to :func:`fromstring`.
+
+        :return: The root element of the element tree.
+        :rtype: xml.etree.ElementTree.Element
+
+        :raises TypeError: If a parameter can not be part of the key of the cache.
+        """
+        params = (tag, attrs, encoding, transport_encoding, sections, sorted(options.items()))
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass") if isinstance(text, str) else text,
+                              digest_size=16, person=b"str" if isinstance(text, str) else b"bytes")
+        key.update(repr(_cache_key(("htmlement", __version__) + params)).encode("utf-8", "surrogatepass"))
+        key = key.hexdigest()
+
+        data = self._get(key)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return pickle.loads(data)
+
+        root = fromstring(text, tag, attrs, encoding, transport_encoding, sections, **options)
+        with self._lock:
+            self.misses += 1
+        self._put(key, pickle.dumps(root, pickle.HIGHEST_PROTOCOL))
+        return root
+
+    def clear(self):
+        """Remove every tree that is kept in memory, the trees in the directory are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _get(self, key):
+        """Return the pickled tree for *key* from memory or from the directory, or None."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+
+        if self.directory is not None:
+            try:
+                with open(os.path.join(self.directory, key + ".pickle"), "rb") as stream:
+                    data = stream.read()
+            except OSError:
+                return None
+            self._put(key, data, persist=False)
+        return data
+
+    def _put(self, key, data, persist=True):
+        """Keep the pickled tree in memory, evicting the least recently used trees, and in the directory."""
+        if persist and self.directory is not None:
+            # Write to a temporary file first, so other processes never read a partial file
+            path = os.path.join(self.directory, key + ".pickle")
+            temp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+            with open(temp, "wb") as stream:
+                stream.write(data)
+            os.replace(temp, path)
+
+        if len(data) > self.max_bytes:
+            return None
+        with self._lock:
+            if key in self._entries:
+                return None
+            self._entries[key] = data
+            self.nbytes += len(data)
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= len(self._entries.popitem(last=False)[1])
+
+
+def _cache_key(value):
+    """
+    Convert a parameter into a value with a stable repr, to be used as part of the key of :class:`ParseCache`.
+
+    :raises TypeError: If the parameter has no stable representation, e.g. a callable or a target.
+    """
+    if value is None or isinstance(value, (str, bytes, bool, int, float)):
+        return value
+    elif isinstance(value, (list, tuple)):
+        return tuple(map(_cache_key, value))
+    elif isinstance(value, (set, frozenset)):
+        return ("set",) + tuple(sorted(map(repr, map(_cache_key, value))))
+    elif isinstance(value, dict):
+        return ("dict",) + tuple(sorted((repr(_cache_key(k)), _cache_key(v)) for k, v in value.items()))
+    elif isinstance(value, Filter):
+        return "Filter", value.tag, _cache_key(value.attrs)
+    elif isinstance(value, re.Pattern):
+        return "Pattern", value.pattern, value.flags
+    raise TypeError("Unable to cache a parse with {!r}".format(value))
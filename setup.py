@@ -30,7 +30,7 @@ setup(
     version=extract_variable('htmlement.py', '__version__'),
     description='Pure-Python HTML parser with ElementTree support.',
     long_description=readfile('README.rst'),
-    extras_require={"dev": ["pytest", "pytest-cov"]},
+    extras_require={"dev": ["pytest", "pytest-cov"], "lxml": ["lxml"], "html5-parser": ["html5-parser"]},
     keywords='html html5 parsehtml htmlparser elementtree dom',
     classifiers=[
         'Development Status :: 5 - Production/Stable',
@@ -39,11 +39,13 @@ setup(
         'Natural Language :: English',
         'Operating System :: OS Independent',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9',
         'Programming Language :: Python :: 3.10',
         'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
+        'Programming Language :: Python :: 3.13',
+        'Programming Language :: Python :: Free Threading :: 2 - Beta',
         'Topic :: Text Processing :: Markup :: HTML',
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
@@ -52,5 +54,6 @@ setup(
     author='William Forde',
     author_email='willforde@gmail.com',
     license='MIT License',
+    python_requires='>=3.8',
     py_modules=['htmlement']
 )
@@ -6,21 +6,36 @@ import xml.etree.ElementTree as Etree
 import htmlement
 import examples
 import tempfile
+import asyncio
+import concurrent.futures
 import pytest
 import io
+import re
 import os
 
 
-def quick_parsehtml(html, encoding=""):
-    obj = htmlement.HTMLement(encoding=encoding)
+@pytest.fixture(params=["stdlib", "fast"])
+def engine(request):
+    # The tests that parse through the helpers are run with each of the tokenizers
+    return request.param
+
+
+def quick_parsehtml(html, encoding="", engine="stdlib"):
+    obj = htmlement.HTMLement(encoding=encoding, engine=engine)
     obj.feed(html)
     root = obj.close()
     assert Etree.iselement(root)
     return root
 
 
-def quick_parse_filter(html, tag, attrs=None, encoding=""):
-    obj = htmlement.HTMLement(tag, attrs, encoding=encoding)
+def quick_parse_filter(html, tag, attrs=None, encoding="", engine="stdlib"):
+    obj = htmlement.HTMLement(tag, attrs, encoding=encoding, engine=engine)
+    obj.feed(html)
+    return obj.close()
+
+
+def quick_parse_filter_multiple(html, tag, attrs=None, encoding="", engine="stdlib"):
+    obj = htmlement.HTMLement(tag, attrs, encoding=encoding, multiple=True, engine=engine)
     obj.feed(html)
     return obj.close()
 
@@ -34,10 +49,10 @@ def test_initialization():
 # ############################# HTML Test ############################## #
 
 
-def test_basic_tree():
+def test_basic_tree(engine):
     # Check that I can parse a simple tree
     html = "<html><body></body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root.tag == "html"
     assert root[0].tag == "body"
 
@@ -54,134 +69,395 @@ def test_basic_partial():
     assert root[0].tag == "body"
 
 
-def test_nohtml_tree():
+def test_nohtml_tree(engine):
     # Check that the missing html starting tag is created
     html = "<body></body>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root.tag == "html"
     assert root[0].tag == "body"
     assert Etree.tostring(root, method="html") == b'<html><body></body></html>'
 
 
-def test_text():
+def test_text(engine):
     html = "<html><body>text</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root.tag == "html"
     assert root[0].tag == "body"
     assert root[0].attrib == {}
     assert root[0].text == "text"
 
 
-def test_attrib():
+def test_attrib(engine):
     html = "<html><body test='yes'>text</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0].attrib == {"test": "yes"}
 
 
-def test_tail():
+def test_tail(engine):
     html = "<html><body test='yes'><p>text</p>tail</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0][0].tail == "tail"
 
 
-def test_self_closing_normal():
+def test_self_closing_normal(engine):
     html = "<html><check test='self closing'/></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0].attrib.get("test") == "self closing"
 
 
-def test_self_closing_void():
+def test_self_closing_void(engine):
     html = "<html><img src='http://myimages.com/myimage.jpg'/></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0].tag == "img"
     assert root[0].attrib.get("src") == "http://myimages.com/myimage.jpg"
 
 
-def test_open_void():
+def test_open_void(engine):
     html = "<html><img src='http://myimages.com/myimage.jpg'></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0].tag == "img"
     assert root[0].attrib.get("src") == "http://myimages.com/myimage.jpg"
 
 
-def test_comment():
+def test_comment(engine):
     html = "<html><body><!--This is a comment.--><p>This is a paragraph.</p></body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0][0].text == "This is a comment."
     assert root[0][1].tag == "p"
     assert root[0][1].text == "This is a paragraph."
 
 
-def test_missing_end_tag():
+def test_missing_end_tag(engine):
     # Test for a missing 'a' end tag
     html = "<html><body><a href='http://google.ie/'>link</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root.find(".//a").get("href") == "http://google.ie/"
     assert Etree.tostring(root, method="html") == b'<html><body><a href="http://google.ie/">link</a></body></html>'
 
 
-def test_extra_tag():
+def test_extra_tag(engine):
     # Check that a extra tag that should not exist was removed
     html = "<html><body></div></body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert len(root[0]) == 0
     assert Etree.tostring(root, method="html") == b'<html><body></body></html>'
 
 
-def test_find_empty_attribute():
+def test_extra_html_end_tag(engine):
+    # Check that a stray html end tag does not close the temporary root element
+    html = "<body><div></html><p>text</p>"
+    root = quick_parsehtml(html, engine=engine)
+    assert Etree.tostring(root, method="html") == b'<html><body><div><p>text</p></div></body></html>'
+
+
+def test_unclosed_deep_nesting(engine):
+    html = "<html><body>" + "<div><p>" * 500 + "text" + "</span>" * 500 + "</body></html>"
+    root = quick_parsehtml(html, engine=engine)
+    assert len(root.findall(".//div")) == 500
+    assert root.find("body").tail is None
+
+
+def test_find_empty_attribute(engine):
     # Check whether we can find an element with an empty-valued attribute
     html = "<html><body><form autofocus><input type='checkbox' checked></form></body></html>"
-    form = quick_parse_filter(html, "form", {"autofocus": True})
+    form = quick_parse_filter(html, "form", {"autofocus": True}, engine=engine)
     assert "autofocus" in form.attrib
     assert form.find(".//input[@checked]") is not None
 
 
+def test_comment_tail(engine):
+    html = "<html><body><p>before<!--comment-->after</p></body></html>"
+    root = quick_parsehtml(html, engine=engine)
+    assert root[0][0].text == "before"
+    assert root[0][0][0].text == "comment"
+    assert root[0][0][0].tail == "after"
+
+
+def test_empty_document(engine):
+    root = quick_parsehtml("", engine=engine)
+    assert root.tag == "html"
+    assert len(root) == 0
+
+
+# ############################# Target Test ############################## #
+
+
+class RecordingTarget(object):
+    def __init__(self):
+        self.calls = []
+
+    def start(self, tag, attrs):
+        self.calls.append(("start", tag, attrs))
+        return tag
+
+    def end(self, tag):
+        self.calls.append(("end", tag))
+        return tag
+
+    def data(self, data):
+        self.calls.append(("data", data))
+
+    def close(self):
+        return self.calls
+
+
+def test_target_calls():
+    html = "<html><body><p class='a'>text<br>tail</body></html>"
+    calls = htmlement.fromstring(html, target=RecordingTarget())
+    assert calls == [("start", "html", {}), ("start", "body", {}), ("start", "p", {"class": "a"}), ("data", "text"),
+                     ("start", "br", {}), ("end", "br"), ("data", "tail"), ("end", "p"), ("end", "body"), ("end", "html")]
+
+
+def test_target_section():
+    html = "<html><body><div id='main'><p>text</p></div></body></html>"
+    target = RecordingTarget()
+    root = htmlement.fromstring(html, "div", {"id": "main"}, target=target)
+    assert root == "div"
+    assert target.calls[0] == ("start", "div", {"id": "main"})
+    assert target.calls[-1] == ("end", "div")
+
+
+def test_target_treebuilder_factory():
+    class Custom(Etree.Element):
+        pass
+
+    html = "<html><body><p>text</p></body></html>"
+    root = htmlement.fromstring(html, target=Etree.TreeBuilder(element_factory=Custom))
+    assert isinstance(root, Custom)
+    assert isinstance(root.find(".//p"), Custom)
+    assert root.find(".//p").text == "text"
+
+
+def test_callbacks():
+    calls = []
+    parser = htmlement.HTMLement(on_start=lambda tag, attrs: calls.append(("start", tag, attrs)),
+                                 on_end=lambda tag: calls.append(("end", tag)),
+                                 on_text=lambda text: calls.append(("text", text)),
+                                 on_comment=lambda text: calls.append(("comment", text)))
+    parser.feed("<body><p class='a'>text<!--note--><br></span>tail</body>")
+    assert parser.close() is None
+    assert calls == [("start", "html", {}), ("start", "body", {}), ("start", "p", {"class": "a"}), ("text", "text"),
+                     ("comment", "note"), ("start", "br", {}), ("end", "br"), ("text", "tail"), ("end", "p"),
+                     ("end", "body"), ("end", "html")]
+
+
+def test_callbacks_section():
+    links = []
+    html = "<html><body><a href='/skip'>skip</a><div id='main'><a href='/1'>1</a><a href='/2'>2</div></body></html>"
+    htmlement.fromstring(html, "div", {"id": "main"}, on_start=lambda tag, attrs: links.append(attrs.get("href")))
+    assert links == [None, "/1", "/2"]
+
+    with pytest.raises(ValueError):
+        htmlement.HTMLement(on_end=print, target=RecordingTarget())
+
+
+def test_attrs_keep():
+    html = ("<html><body><div id='main' style='color: red' data-json='{}'><a href='/' class='link' "
+            "onclick='track()'>link</a><img src='x.png' alt='x' data-src='y.png'></div></body></html>")
+    root = htmlement.fromstring(html, "div", {"id": "main", "style": True}, attrs_keep={"id", "href", "src", "class"})
+    assert root.attrib == {"id": "main"}
+    assert root.find("a").attrib == {"href": "/", "class": "link"}
+    assert root.find("img").attrib == {"src": "x.png"}
+
+
+def test_attrs_per_tag():
+    html = "<html><body><a href='/' style='x' title='t'>link</a><img src='x.png' style='y'></body></html>"
+    root = htmlement.fromstring(html, attrs_drop={"a": {"title"}, "*": {"style"}})
+    assert root.find(".//a").attrib == {"href": "/", "style": "x"}
+    assert root.find(".//img").attrib == {"src": "x.png"}
+
+    root = htmlement.fromstring(html, attrs_keep={"img": {"src"}})
+    assert root.find(".//a").attrib == {"href": "/", "style": "x", "title": "t"}
+    assert root.find(".//img").attrib == {"src": "x.png"}
+
+    with pytest.raises(ValueError):
+        htmlement.HTMLement(attrs_keep={"href"}, attrs_drop={"style"})
+
+
+QUERY_PATHS = [".//p", "body/div/p", ".//p[@class='x']", ".//div/*", ".//p[2]", ".//*[@href]", ".//div[p]",
+               "body/*[last()]", ".//p[last()-1]", "*", ".//div[span='s']", ".//p[.='two']", ".", "./body",
+               ".//b/..", "body/div/div/p[1]", ".//*[@id='main']//p[@class='x']", "body/div/p[1]/b"]
+
+
+@pytest.mark.parametrize("target", [None, htmlement.CompactTreeBuilder])
+def test_queryset_findall(target):
+    html = ("<html><body><div id='main' class='box'><p>one <b>bold</b> tail</p><!--note--><p class='x'>two</p>"
+            "<a href='/next'>next</a><div><p class='x'>three</p><span>s</span></div></div><span>end</span></body></html>")
+    root = htmlement.fromstring(html, target=target() if target else None)
+    results = htmlement.QuerySet(QUERY_PATHS).findall(root)
+    assert list(results) == QUERY_PATHS
+    for path in QUERY_PATHS:
+        assert results[path] == root.findall(path), path
+
+
+def test_queryset_named():
+    html = "<html><body><div><div><p>one</p></div><p>two</p></div><h1>title</h1></body></html>"
+    root = htmlement.fromstring(html)
+    queries = htmlement.QuerySet({"title": ".//h1", "nested": ".//div//p", "missing": ".//table"})
+    # Elements matched through more than one ancestor are only returned once
+    assert [elem.text for elem in queries.findall(root)["nested"]] == ["one", "two"]
+    assert {name: elem if elem is None else elem.text for name, elem in queries.find(root).items()} == \
+           {"title": "title", "nested": "one", "missing": None}
+
+
+def test_index_builder():
+    html = ("<html><body><div id='main' class='box wide'><p class='x'>one</p><!--note-->"
+            "<p id='main' class='x box'>two</p></div><br></body></html>")
+    index = htmlement.IndexBuilder()
+    root = htmlement.fromstring(html, target=index)
+    assert index.get_element_by_id("main") is root.find(".//div")
+    assert index.get_element_by_id("missing") is None
+    assert list(index.iter_by_class("box")) == [root.find(".//div"), root.findall(".//p")[1]]
+    assert list(index.iter_by_tag("p")) == root.findall(".//p")
+    assert list(index.iter_by_class("missing")) == []
+    assert index.getparent(root.find(".//p")) is root.find(".//div")
+    assert index.getparent(root.find(".//br")) is root.find("body")
+    assert index.getparent(root) is None
+    assert root.find(".//div")[1].text == "note"
+
+
+def test_index_builder_sections():
+    html = "<html><body><p class='a'>one</p><p>two</p><p class='a'>three</p></body></html>"
+    index = htmlement.IndexBuilder()
+    sections = htmlement.fromstring(html, "p", multiple=True, target=index)
+    assert [elem.text for elem in sections] == ["one", "two", "three"]
+    assert [elem.text for elem in index.iter_by_class("a")] == ["one", "three"]
+
+    index = htmlement.IndexBuilder(htmlement.CompactTreeBuilder())
+    root = htmlement.fromstring(html, target=index)
+    assert index.getparent(next(index.iter_by_tag("p"))) == root.find("body")
+
+
+def test_intern_names():
+    html = "<html><body><DIV Class='a' data-Custom-Name='1'>text</DIV></body></html>"
+    first = htmlement.fromstring(html).find(".//div")
+    second = htmlement.fromstring(html).find(".//div")
+    assert first.tag is second.tag
+    assert [key for key in first.attrib] == ["class", "data-custom-name"]
+    assert all(a is b for a, b in zip(first.attrib, second.attrib))
+
+    third = htmlement.fromstring(html, intern_names=False).find(".//div")
+    assert third.tag == "div" and third.tag is not first.tag
+
+
+def test_intern_names_limit(monkeypatch):
+    monkeypatch.setattr(htmlement, "_NAMES_LIMIT", len(htmlement._NAMES))
+    root = htmlement.fromstring("<html><body><unknown-tag-name>text</unknown-tag-name></body></html>")
+    assert root.find(".//unknown-tag-name").text == "text"
+    assert "unknown-tag-name" not in htmlement._NAMES
+
+
+COMPACT_HTML = ("<html><body><div id='main' class='box'><p>one <b>bold</b> tail</p><!--note-->"
+                "<p class='x'>two</p><a href='/next'>next</a></div><span>end</span></body></html>")
+
+
+@pytest.mark.parametrize("path", [".//p", "body/div/p", ".//p[@class='x']", ".//div/*", ".//p[2]",
+                                  ".//*[@href]", ".//div[p]", ".//b/..", "body/*[last()]"])
+def test_compact_findall(path):
+    expected = htmlement.fromstring(COMPACT_HTML)
+    root = htmlement.fromstring(COMPACT_HTML, target=htmlement.CompactTreeBuilder())
+    assert [(elem.tag, elem.text, elem.tail, elem.attrib) for elem in root.findall(path)] == \
+           [(elem.tag, elem.text, elem.tail, elem.attrib) for elem in expected.findall(path)]
+
+
+def test_compact_element():
+    root = htmlement.fromstring(COMPACT_HTML, target=htmlement.CompactTreeBuilder())
+    div = root.find(".//div")
+    assert isinstance(div, htmlement.CompactElement)
+    assert div.get("id") == "main"
+    assert div.get("missing", "default") == "default"
+    assert sorted(div.keys()) == ["class", "id"]
+    assert len(div) == 4
+    assert div[1].tag is Etree.Comment
+    assert div[1].text == "note"
+    assert div[0].tail is None
+    assert div[1].tail is None
+    assert "".join(div[0].itertext()) == "one bold tail"
+    assert [elem.tag for elem in root.iter("p")] == ["p", "p"]
+    assert root.findtext(".//span") == "end"
+    assert div == root.find(".//div[@id='main']")
+
+
+def test_compact_section():
+    root = htmlement.fromstring(COMPACT_HTML, "div", {"id": "main"}, target=htmlement.CompactTreeBuilder())
+    assert root.tag == "div"
+    assert [elem.text for elem in root.iterfind("p")] == ["one ", "two"]
+
+
+def test_skip_tags():
+    html = ("<html><head><style>p {color: red}</style><script>var x = '<p>';</script></head>"
+            "<body><p>one<svg><g><path d='M0'/><text>icon</text></g></svg> two</p><!--note-->"
+            "<div><noscript><img src='x.png'></div><p>three</p></body></html>")
+    root = htmlement.fromstring(html, skip_tags={"script", "style", "svg", "noscript"}, comments=False)
+    assert [elem.tag for elem in root.iter()] == ["html", "head", "body", "p", "div", "p"]
+    assert root.find(".//p").text == "one two"
+    assert root.findall(".//p")[1].text == "three"
+
+
+def test_keep_tags():
+    html = "<html><body><div id='main'><p>text <span>inline</span><a href='/'>link</a></p></div></body></html>"
+    root = htmlement.fromstring(html, "div", {"id": "main"}, keep_tags={"p", "a"})
+    assert [elem.tag for elem in root.iter()] == ["div", "p", "a"]
+    assert root.find("p/a").get("href") == "/"
+
+    with pytest.raises(ValueError):
+        htmlement.HTMLement(skip_tags={"script"}, keep_tags={"p"})
+
+
+def test_skip_tags_unclosed():
+    # The end tag of an open element also closes the pruned subtree
+    html = "<html><body><div><svg><g>icon</div><p>text</p></body></html>"
+    root = htmlement.fromstring(html, skip_tags={"svg"})
+    assert [elem.tag for elem in root.iter()] == ["html", "body", "div", "p"]
+    assert root.find(".//p").text == "text"
+
+
 # ############################# HTML Entity ############################## #
 
 
-def test_entity_name_euro():
+def test_entity_name_euro(engine):
     html = "<html><body>cost is &euro;49.99</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0].text == "cost is €49.99"
 
 
-def test_entity_number_euro():
+def test_entity_number_euro(engine):
     html = "<html><body>cost is &#8364;49.99</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0].text == "cost is €49.99"
 
 
-def test_entity_hex_euro():
+def test_entity_hex_euro(engine):
     html = "<html><body>cost is &#x20AC;49.99</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert root[0].text == "cost is €49.99"
 
 
-def test_entity_name_euro_fail():
+def test_entity_name_euro_fail(engine):
     html = "<html><body>cost is &euros;49.99</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert "euros" in root[0].text
 
 
-def test_entity_hex_euro_fail():
+def test_entity_hex_euro_fail(engine):
     html = "<html><body>cost is &#xDB9900;49.99</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     assert "€" not in root[0].text
 
 
 # ############################# Text Content ############################# #
 
 
-def test_text_iterator():
+def test_text_iterator(engine):
     html = "<html><body>sample text content</body></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     body = root.find(".//body")
     assert "".join(body.itertext()) == "sample text content"
 
 
-def test_text_iterator_unclosed_tag():
+def test_text_iterator_unclosed_tag(engine):
     html = "<html><body><div>hello <span>to <span>the <span>world!</div></body><footer>unrelated</footer></html>"
-    root = quick_parsehtml(html)
+    root = quick_parsehtml(html, engine=engine)
     body = root.find(".//body")
     assert "".join(body.itertext()) == "hello to the world!"
 
@@ -189,57 +465,85 @@ def test_text_iterator_unclosed_tag():
 # ############################# Filter Test ############################## #
 
 
-def test_tag_match():
+def test_tag_match(engine):
     html = "<html><body><div test='attribute'><p>text</p></div></body></html>"
-    root = quick_parse_filter(html, "div")
+    root = quick_parse_filter(html, "div", engine=engine)
     assert root.tag == "div"
     assert root[0].tag == "p"
 
 
-def test_tag_no_match():
+def test_tag_no_match(engine):
     html = "<html><body></body></html>"
     with pytest.raises(RuntimeError) as excinfo:
-        quick_parse_filter(html, "div")
+        quick_parse_filter(html, "div", engine=engine)
     excinfo.match("Unable to find requested section with tag of")
 
 
-def test_attrib_match():
+def test_attrib_match(engine):
     html = "<html><body><div test='attribute'><p>text</p></div><div test='yes'>text</div></body></html>"
-    root = quick_parse_filter(html, "div", {"test": "yes"})
+    root = quick_parse_filter(html, "div", {"test": "yes"}, engine=engine)
     assert root.tag == "div"
     assert root.get("test") == "yes"
     assert root.text == "text"
 
 
-def test_attrib_no_match():
+def test_attrib_no_match(engine):
     html = "<html><body><div><p>text</p></div><div>text</div></body></html>"
     with pytest.raises(RuntimeError) as excinfo:
-        quick_parse_filter(html, "div", {"test": "yes"})
+        quick_parse_filter(html, "div", {"test": "yes"}, engine=engine)
     excinfo.match("Unable to find requested section with tag of")
 
 
-def test_attrib_match_name():
+def test_attrib_match_name(engine):
     # Search for any div tag with a attribute of src of any value
     html = "<html><body><div test='attribute'><p>text</p></div><div src='foo bar'>text</div></body></html>"
-    root = quick_parse_filter(html, "div", {"src": True})
+    root = quick_parse_filter(html, "div", {"src": True}, engine=engine)
     assert root.tag == "div"
     assert root.get("src")
     assert root.text == "text"
 
 
-def test_attrib_match_unwanted():
+def test_attrib_match_unwanted(engine):
     # Search for a div with a test attribute but not a src attribute
     html = "<html><body><div src='attribute' test='yes'><p>text</p></div><div test='yes'>text</div></body></html>"
-    root = quick_parse_filter(html, "div", {"test": "yes", "src": False})
+    root = quick_parse_filter(html, "div", {"test": "yes", "src": False}, engine=engine)
     assert root.tag == "div"
     assert root.get("test") == "yes"
     assert "src" not in root.attrib
     assert root.text == "text"
 
 
-def test_tag_match_badhtml():
+def test_attrib_match_class_token(engine):
+    html = "<html><body><div class='item'>one</div><div class='featured  item new'>two</div></body></html>"
+    root = quick_parse_filter(html, "div", {"class": "new item"}, engine=engine)
+    assert root.text == "two"
+
+
+def test_attrib_match_regex_callable(engine):
+    html = "<html><body><a href='/a/1'>one</a><a href='/b/22' title='Two'>two</a></body></html>"
+    root = quick_parse_filter(html, "a", {"href": re.compile(r"/b/\d+"), "title": str.istitle}, engine=engine)
+    assert root.text == "two"
+
+
+def test_filter_reuse(engine):
+    attrs = {"test": "yes", "src": False}
+    compiled = htmlement.Filter("div", attrs)
+    assert attrs == {"test": "yes", "src": False}
+    html = "<html><body><div src='attribute' test='yes'><p>text</p></div><div test='yes'>text</div></body></html>"
+    for _ in range(3):
+        root = quick_parse_filter(html, compiled, engine=engine)
+        assert root.text == "text"
+        assert "src" not in root.attrib
+
+
+def test_filter_unsupported():
+    with pytest.raises(TypeError):
+        htmlement.Filter("div", {"test": 1.5})
+
+
+def test_tag_match_badhtml(engine):
     html = "<html><body><div test='attribute'><p>text</div></body></html>"
-    root = quick_parse_filter(html, "div")
+    root = quick_parse_filter(html, "div", engine=engine)
     assert root.tag == "div"
     assert root[0].tag == "p"
 
@@ -255,102 +559,314 @@ def test_partial_filter():
     assert root[0].tag == "p"
 
 
+def test_multiple_sections(engine):
+    html = ("<html><body><div class='item'><p>one</p></div><div>skip</div>"
+            "<div class='item'>two<div class='item'>nested</div></div><img class='item'>"
+            "<div class='item'>three</body></html>")
+    sections = quick_parse_filter_multiple(html, "div", {"class": "item"}, engine=engine)
+    assert [Etree.tostring(elem, method="html") for elem in sections] == [
+        b'<div class="item"><p>one</p></div>',
+        b'<div class="item">two<div class="item">nested</div></div>',
+        b'<div class="item">three</div>']
+
+
+def test_multiple_sections_read():
+    html = "<ul><li>one</li><li>two</li><li>three</li></ul>"
+    obj = htmlement.HTMLement("li", multiple=True)
+    obj.feed(html[:24])
+    assert [elem.text for elem in obj.read_sections()] == ["one"]
+    obj.feed(html[24:])
+    assert [elem.text for elem in obj.read_sections()] == ["two", "three"]
+    assert obj.close() == []
+
+
+def test_multiple_sections_no_match(engine):
+    html = "<html><body></body></html>"
+    with pytest.raises(RuntimeError) as excinfo:
+        quick_parse_filter_multiple(html, "div", engine=engine)
+    excinfo.match("Unable to find requested section with tag of")
+
+
+def test_itersections():
+    rows = "".join("<tr class='row'><td>{}</td></tr><tr><td>skip</td></tr>".format(i) for i in range(50))
+    html = "<html><body><table>{}</table></body></html>".format(rows)
+    sections = htmlement.itersections(io.StringIO(html), "tr", {"class": "row"}, buffer_size=64)
+    assert [elem.findtext("td") for elem in sections] == [str(i) for i in range(50)]
+
+
+def test_extract():
+    items = "".join("<div class='item' data-id='{0}'><h2> Item <b>{0}</b> </h2><a href='/item/{0}'>more</a>"
+                    "<span class='price'>{0}.99</span></div><div class='ad'>skip</div>".format(i) for i in range(20))
+    html = "<html><body>{}<div class='item'><h2>last</h2></div></body></html>".format(items).encode("utf-8")
+    fields = {"id": "@data-id", "title": "h2", "link": "a/@href", "price": ".//span[@class='price']"}
+    records = list(htmlement.extract(io.BytesIO(html), "div", {"class": "item"}, fields, "utf-8", buffer_size=64))
+    assert len(records) == 21
+    assert records[3] == {"id": "3", "title": "Item 3", "link": "/item/3", "price": "3.99"}
+    assert records[-1] == {"id": None, "title": "last", "link": None, "price": None}
+
+
+def test_extract_predicates():
+    # Paths that depend on the children of an element, are matched against one record at a time
+    html = ("<html><body><ul><li><p>a</p><p>b<!--note--></p><p class='x'>c</p></li><li><p>d</p></li></ul>"
+            "</body></html>")
+    fields = {"text": ".", "last": "p[last()]", "second": "p[2]", "x": "p[@class='x']", "with_class": "*[@class]/@class"}
+    records = list(htmlement.extract(io.StringIO(html), "li", fields=fields))
+    assert records == [{"text": "abc", "last": "c", "second": "b", "x": "c", "with_class": "x"},
+                       {"text": "d", "last": "d", "second": None, "x": None, "with_class": None}]
+
+
+def test_named_sections():
+    html = ("<html><body><ul class='crumbs'><li>home</li></ul><h1>Title</h1>"
+            "<div class='product'><span class='price'>9.99</span></div>"
+            "<div class='footer'>footer</div></body></html>")
+    sections = {"title": "h1", "crumbs": ("ul", {"class": "crumbs"}), "product": ("div", {"class": "product"}),
+                "price": ("span", {"class": "price"}), "missing": ("table", {"id": "missing"})}
+    results = htmlement.fromstring(html, sections=sections)
+    assert list(results) == ["title", "crumbs", "product", "price", "missing"]
+    assert results["title"].text == "Title"
+    assert results["crumbs"][0].text == "home"
+    assert results["product"][0] is results["price"]
+    assert results["price"].text == "9.99"
+    assert results["missing"] is None
+
+
+def test_named_sections_early_exit():
+    html = "<html><body><h1>Title</h1><p>text</p></body></html>"
+    obj = htmlement.HTMLement(sections={"title": "h1", "text": "p"})
+    obj.feed(html)
+    assert obj._finished
+    results = obj.close()
+    assert results["title"].text == "Title"
+    assert results["text"].text == "text"
+
+
+def test_named_sections_with_tag():
+    with pytest.raises(ValueError):
+        htmlement.HTMLement("div", sections={"title": "h1"})
+
+
+def test_skip_false_positives(engine):
+    # Check that tags within comments, scripts, styles and CDATA sections are not matched
+    html = ("<html><head><script type='text/javascript'>var x = '<div id=\"main\">script</div>';</script>"
+            "<style>/* <div id='main'>style</div> */</style></head><body><!-- <div id='main'>comment</div> -->"
+            "<![CDATA[<div id='main'>cdata</div>]]><DIV id='other'>other</DIV><div id='main'><p>content</p></div>"
+            "</body></html>")
+    root = quick_parse_filter(html, "div", {"id": "main"}, engine=engine)
+    assert root.get("id") == "main"
+    assert root[0].text == "content"
+
+    # Check that the same section is found, no matter how the document is split up
+    obj = htmlement.HTMLement("div", {"id": "main"})
+    for char in html:
+        obj.feed(char)
+    root = obj.close()
+    assert Etree.tostring(root) == b'<div id="main"><p>content</p></div>'
+
+
+def test_skip_raw_text_filter(engine):
+    html = "<html><head><script>var x = '<script id=1>';</script><script id='1'>code</script></head></html>"
+    root = quick_parse_filter(html, "script", {"id": "1"}, engine=engine)
+    assert root.text == "code"
+
+
+def test_skip_self_closing_raw_text(engine):
+    # A self closing script or style element has no raw text, so the section after it is still found
+    html = "<div><script src='a.js'/><style/></div><div class='a'><p>hit</p><p>two</p></div>"
+    root = quick_parse_filter(html, "div", {"class": "a"}, engine=engine)
+    assert root.findtext("p") == "hit"
+
+    root = htmlement.parse_split(html, "div", {"class": "a"}, segment_size=1, executor="thread", engine=engine)
+    assert [elem.text for elem in root] == ["hit", "two"]
+
+
+def test_skip_multiple_sections_split():
+    html = "<ul><li class='a'>one</li><li>skip</li><!--<li class='a'>no</li>--><li class='a'>two</li></ul>"
+    obj = htmlement.HTMLement("li", {"class": "a"}, multiple=True)
+    for char in html:
+        obj.feed(char)
+    assert [elem.text for elem in obj.close()] == ["one", "two"]
+
+
 # ####################### Unicode Decoding Test ####################### #
 
 
-def test_with_encoding():
+def test_with_encoding(engine):
     # Check that I can parse a simple tree
     html = b"<html><body></body></html>"
-    root = quick_parsehtml(html, encoding="utf-8")
+    root = quick_parsehtml(html, encoding="utf-8", engine=engine)
     assert root.tag == "html"
     assert root[0].tag == "body"
 
 
-def test_no_encoding_with_header_type1(recwarn):
+def test_split_multibyte_chunks():
+    # Check that a multi-byte character split across two chunks is decoded
+    html = "<html><body>cost is €49.99</body></html>".encode("utf-8")
+    split = html.index(b"\xe2") + 1
+    obj = htmlement.HTMLement(encoding="utf-8")
+    obj.feed(html[:split])
+    obj.feed(html[split:])
+    root = obj.close()
+    assert root[0].text == "cost is €49.99"
+
+
+def test_memoryview_chunks():
+    # Check that bytearray and memoryview chunks are accepted
+    html = bytearray("<html><body>cost is €49.99</body></html>".encode("utf-8"))
+    view = memoryview(html)
+    obj = htmlement.HTMLement(encoding="utf-8")
+    for i in range(0, len(html), 3):
+        obj.feed(view[i:i + 3])
+    root = obj.close()
+    assert root[0].text == "cost is €49.99"
+
+
+def test_truncated_multibyte():
+    html = "<html><body>€</body></html>".encode("utf-8")[:14]
+    obj = htmlement.HTMLement(encoding="utf-8")
+    obj.feed(html)
+    with pytest.raises(UnicodeDecodeError):
+        obj.close()
+
+
+def test_no_encoding_with_header_type1(recwarn, engine):
     # Check for charset header type one
     html = b"<html><head><meta charset='utf-8'/></head><body>text</body></html>"
-    quick_parsehtml(html)
+    quick_parsehtml(html, engine=engine)
     # Check that no warnings ware raised
     warnmsg = "Unable to determine encoding, defaulting to iso-8859-1"
     for w in recwarn.list:
         assert issubclass(w.category, UnicodeWarning) is False or not w.message == warnmsg
 
 
-def test_no_encoding_with_header_type2(recwarn):
+def test_no_encoding_with_header_type2(recwarn, engine):
     # Check for charset header type one
     html = b'<html><head><meta charset="utf-8"/></head><body>text</body></html>'
-    quick_parsehtml(html)
+    quick_parsehtml(html, engine=engine)
     # Check that no warnings ware raised
     warnmsg = "Unable to determine encoding, defaulting to iso-8859-1"
     for w in recwarn.list:
         assert issubclass(w.category, UnicodeWarning) is False or not w.message == warnmsg
 
 
-def test_no_encoding_with_header_type3(recwarn):
+def test_no_encoding_with_header_type3(recwarn, engine):
     # Check for charset header type one
     html = b"<html><head><meta charset='utf-8'></head><body>text</body></html>"
-    quick_parsehtml(html)
+    quick_parsehtml(html, engine=engine)
     # Check that no warnings ware raised
     warnmsg = "Unable to determine encoding, defaulting to iso-8859-1"
     for w in recwarn.list:
         assert issubclass(w.category, UnicodeWarning) is False or not w.message == warnmsg
 
 
-def test_no_encoding_with_header_type4(recwarn):
+def test_no_encoding_with_header_type4(recwarn, engine):
     # Check for charset header type one
     html = b'<html><head><meta charset="utf-8"></head><body>text</body></html>'
-    quick_parsehtml(html)
+    quick_parsehtml(html, engine=engine)
     # Check that no warnings ware raised
     warnmsg = "Unable to determine encoding, defaulting to iso-8859-1"
     for w in recwarn.list:
         assert issubclass(w.category, UnicodeWarning) is False or not w.message == warnmsg
 
 
-def test_no_encoding_with_header_type5(recwarn):
+def test_no_encoding_with_header_type5(recwarn, engine):
     # Check for charset header type one
     html = b"<html><head><meta content='text/html; charset=utf-8'/></head><body>text</body></html>"
-    quick_parsehtml(html)
+    quick_parsehtml(html, engine=engine)
     # Check that no warnings ware raised
     warnmsg = "Unable to determine encoding, defaulting to iso-8859-1"
     for w in recwarn.list:
         assert issubclass(w.category, UnicodeWarning) is False or not w.message == warnmsg
 
 
-def test_no_encoding_with_header_type6(recwarn):
+def test_no_encoding_with_header_type6(recwarn, engine):
     # Check for charset header type one
     html = b'<html><head><meta content="text/html; charset=utf-8"/></head><body>text</body></html>'
-    quick_parsehtml(html)
+    quick_parsehtml(html, engine=engine)
     # Check that no warnings ware raised
     warnmsg = "Unable to determine encoding, defaulting to iso-8859-1"
     for w in recwarn.list:
         assert issubclass(w.category, UnicodeWarning) is False or not w.message == warnmsg
 
 
-def test_no_encoding_with_header_type7(recwarn):
+def test_no_encoding_with_header_type7(recwarn, engine):
     # Check for charset header type one
     html = b"<html><head><meta content='text/html; charset=utf-8'></head><body>text</body></html>"
-    quick_parsehtml(html)
+    quick_parsehtml(html, engine=engine)
     # Check that no warnings ware raised
     warnmsg = "Unable to determine encoding, defaulting to iso-8859-1"
     for w in recwarn.list:
         assert issubclass(w.category, UnicodeWarning) is False or not w.message == warnmsg
 
 
-def test_no_encoding_with_header_type8(recwarn):
+def test_no_encoding_with_header_type8(recwarn, engine):
     # Check for charset header type one
     html = b'<html><head><meta content="text/html; charset=utf-8"></head><body>text</body></html>'
-    quick_parsehtml(html)
+    quick_parsehtml(html, engine=engine)
     # Check that no warnings ware raised
     warnmsg = "Unable to determine encoding, defaulting to iso-8859-1"
     for w in recwarn.list:
         assert issubclass(w.category, UnicodeWarning) is False or not w.message == warnmsg
 
 
-def test_no_encoding_no_header():
+def test_no_encoding_no_header(engine):
     # Check that I can parse a simple tree
     html = b"<html><head></head><body>text</body></html>"
     with pytest.warns(UnicodeWarning):
-        quick_parsehtml(html)
+        quick_parsehtml(html, engine=engine)
+
+
+def _parse_feed(html):
+    obj = htmlement.HTMLement()
+    obj.feed(html)
+    return obj.close()
+
+
+def _parse_close(html):
+    obj = htmlement.HTMLement()
+    obj.feed(html[:10])
+    return obj.close()
+
+
+@pytest.mark.parametrize("parse", [_parse_feed, _parse_close, htmlement.fromstring,
+                                   lambda html: htmlement.parse(io.BytesIO(html)),
+                                   lambda html: list(htmlement.iterparse(io.BytesIO(html)))])
+def test_no_encoding_warning_location(parse):
+    # The warning points at the code that called into htmlement, whichever function that is
+    with pytest.warns(UnicodeWarning) as record:
+        parse(b"<html><body>text</body></html>")
+    assert record[0].filename == __file__
+
+
+def test_no_encoding_transport_encoding(recwarn):
+    # Check that the encoding given by the transport layer is used
+    html = "<html><body>cost is €49.99</body></html>".encode("utf-8")
+    obj = htmlement.HTMLement(transport_encoding="utf-8")
+    obj.feed(html)
+    root = obj.close()
+    assert root[0].text == "cost is €49.99"
+    assert obj.encoding == "utf-8"
+    assert not [w for w in recwarn.list if issubclass(w.category, UnicodeWarning)]
+
+
+def test_no_encoding_bom(engine):
+    # Check that the byte order mark wins over the meta tags
+    html = "<html><head><meta charset='iso-8859-1'></head><body>€</body></html>".encode("utf-8-sig")
+    root = quick_parsehtml(html, engine=engine)
+    assert root.tag == "html"
+    assert root[1].text == "€"
+
+
+def test_no_encoding_xml_declaration(engine):
+    html = "<?xml version='1.0' encoding='utf-8'?><html><body>€</body></html>".encode("utf-8")
+    root = quick_parsehtml(html, engine=engine)
+    assert root[0].text == "€"
+
+
+def test_no_encoding_charset_after_prescan(engine):
+    # Check that a charset outside of the first 1024 bytes is ignored
+    html = b"<html><body>" + b" " * 2048 + b"<meta charset='utf-8'></body></html>"
+    with pytest.warns(UnicodeWarning):
+        quick_parsehtml(html, engine=engine)
 
 
 # ####################### Funtion Tests ####################### #
@@ -400,6 +916,55 @@ def test_parse_filename():
         os.remove(filename)
 
 
+def test_parse_binary_file_object():
+    # Check that a multi-byte character split across the read buffer is decoded
+    html = "<html><head><meta charset='utf-8'></head><body>cost is €49.99</body></html>".encode("utf-8")
+    fileobj = io.BytesIO(html)
+    root = htmlement.parse(fileobj, buffer_size=7)
+    assert root[1].text == "cost is €49.99"
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_parse_filename_sniff(memory_map):
+    html = "<html><head><meta charset='utf-8'></head><body>cost is €49.99</body></html>"
+    fileobj = tempfile.NamedTemporaryFile("wb", delete=False)
+    fileobj.write(html.encode("utf-8"))
+    filename = fileobj.name
+    fileobj.close()
+
+    try:
+        root = htmlement.parse(filename, buffer_size=16, memory_map=memory_map)
+        assert root[1].text == "cost is €49.99"
+    finally:
+        os.remove(filename)
+
+
+def test_iterparse_events():
+    html = "<html><body><!--note--><p>text<br></p><div>unclosed</body></html>"
+    fileobj = io.StringIO(html)
+    events = [(event, elem.tag if event != "comment" else elem.text)
+              for event, elem in htmlement.iterparse(fileobj, events=("start", "end", "comment"))]
+    assert events == [("start", "html"), ("start", "body"), ("comment", "note"), ("start", "p"),
+                      ("start", "br"), ("end", "br"), ("end", "p"), ("start", "div"), ("end", "div"),
+                      ("end", "body"), ("end", "html")]
+
+
+def test_iterparse_tag_clear():
+    rows = "".join("<tr><td>{}</td></tr>".format(i) for i in range(100))
+    html = "<html><body><table>{}</table></body></html>".format(rows).encode("utf-8")
+    fileobj = io.BytesIO(html)
+    values = []
+    table = None
+    for event, elem in htmlement.iterparse(fileobj, events=("start", "end"), encoding="utf-8", buffer_size=64):
+        if event == "start" and elem.tag == "table":
+            table = elem
+        elif event == "end" and elem.tag == "tr":
+            values.append(elem[0].text)
+            table.clear()
+            assert len(table) == 0
+    assert values == [str(i) for i in range(100)]
+
+
 # ####################### Examples Tests ####################### #
 
 
@@ -416,3 +981,287 @@ def test_example_filter():
 def test_example_complex():
     # Check that there is no errors
     examples.example_complex()
+
+
+def test_engine_equivalent():
+    # Unusual markup is handed to HTMLParser, so both engines build the same tree, however the data is split
+    html = ("<!DOCTYPE html><div id=a class='b &amp; c'><p>x &amp; y<br/><img src=\"1\" alt></p><!-- c -->"
+            "<script>if (a < b) {}</script><a b=c d='e'f=g>k</a><x a==b/>< text</ div><?pi?><![CDATA[z]]></div>")
+    for size in (1, 3, len(html)):
+        results = []
+        for engine in ("stdlib", "fast"):
+            parser = htmlement.HTMLement(engine=engine)
+            for i in range(0, len(html), size):
+                parser.feed(html[i:i + size])
+            results.append(Etree.tostring(parser.close()))
+        assert results[0] == results[1]
+
+
+def test_engine_unknown():
+    with pytest.raises(ValueError):
+        htmlement.HTMLement(engine="lxml")
+
+
+BACKENDS = ["stdlib", "auto"] + [
+    pytest.param(name, marks=pytest.mark.skipif(not htmlement._BACKENDS[name], reason="{} is not installed".format(name)))
+    for name in ("lxml", "html5-parser")]
+BACKEND_HTML = ("<!DOCTYPE html><html><head><title>Title</title></head><body><div id='main' class='x'>"
+                "<p>one<br>two</p><img src='1'><!-- note --></div><div id='other'>&amp; more</div></body></html>")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_tree(backend):
+    root = htmlement.fromstring(BACKEND_HTML, backend=backend)
+    assert Etree.iselement(root)
+    assert root.tag == "html"
+    assert root.find("head/title").text == "Title"
+    assert root.find(".//div[@id='other']").text == "& more"
+
+    # Void elements never have children
+    br = root.find(".//p/br")
+    assert len(br) == 0
+    assert br.tail == "two"
+    assert len(root.find(".//img")) == 0
+    assert root.find(".//div[@id='main']")[-1].text == "note"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_sections(backend):
+    section = htmlement.fromstring(BACKEND_HTML, "div", {"id": "other"}, backend=backend)
+    assert section.tag == "div"
+    assert section.text == "& more"
+
+    sections = htmlement.fromstring(BACKEND_HTML, "div", multiple=True, backend=backend)
+    assert [elem.get("id") for elem in sections] == ["main", "other"]
+
+    root = htmlement.fromstring(BACKEND_HTML, backend=backend, skip_tags={"p"}, attrs_keep={"id"})
+    assert root.find(".//p") is None
+    assert root.find(".//div[@id='main']").attrib == {"id": "main"}
+
+
+def test_backend_unknown():
+    with pytest.raises(ValueError):
+        htmlement.HTMLement(backend="html5lib")
+
+
+@pytest.mark.skipif(htmlement._BACKENDS["lxml"], reason="lxml is installed")
+def test_backend_missing():
+    with pytest.raises(ImportError):
+        htmlement.HTMLement(backend="lxml")
+
+
+def find_title(root):
+    # Extract functions are pickled, so they are defined at module level
+    return root.findtext("title")
+
+
+def test_parse_many():
+    pages = ["<html><head><title>{}</title></head></html>".format(i) for i in range(20)]
+    pages[5] = "<html><body>No head</body></html>"
+    results = list(htmlement.parse_many(pages, "head", extract=find_title, workers=2, chunksize=3))
+    assert [result.index for result in results] == list(range(20))
+    assert results[0] == (0, "0", None)
+    assert results[19].result == "19"
+
+    # A failed document is reported without stopping the batch
+    assert results[5].result is None
+    assert isinstance(results[5].error, RuntimeError)
+    assert all(result.error is None for result in results if result.index != 5)
+
+
+def test_parse_many_unordered(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / "{}.html".format(i)
+        path.write_bytes("<html><p>é{}</p></html>".format(i).encode("utf-8"))
+        paths.append(path)
+
+    results = htmlement.parse_many(iter(paths), workers=2, ordered=False, encoding="utf-8")
+    results = sorted(results, key=lambda result: result.index)
+    assert [result.result.findtext("p") for result in results] == ["é{}".format(i) for i in range(6)]
+
+
+class Body(object):
+    """Async iterable of chunks, that records how much was read and if it was closed."""
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.read = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.read == len(self.chunks):
+            raise StopAsyncIteration
+        self.read += 1
+        await asyncio.sleep(0)
+        return self.chunks[self.read - 1]
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_parse_async():
+    html = "<html><body><div id='main'>Text ✓</div>" + "<p>filler</p>" * 1000 + "</body></html>"
+    body = Body(html.encode("utf-8")[i:i + 100] for i in range(0, len(html), 100))
+    root = asyncio.run(htmlement.parse_async(body, "div", {"id": "main"}, encoding="utf-8"))
+    assert root.text == "Text ✓"
+
+    # Reading stops as soon as the section is complete
+    assert body.read < 5
+    assert body.closed
+
+    body = Body([html[:50], html[50:]])
+    root = asyncio.run(htmlement.parse_async(body, buffer_size=16))
+    assert len(root.findall(".//p")) == 1000
+
+
+def test_aiterparse():
+    async def links(body):
+        found = []
+        async for event, elem in htmlement.aiterparse(body, tag="a"):
+            found.append(elem.get("href"))
+            if len(found) == 2:
+                break
+        return found
+
+    body = Body(["<html><body>", "<a href='1'>", "</a><a href='2'></a>", "<a href='3'></a>", "</body></html>"])
+    assert asyncio.run(links(body)) == ["1", "2"]
+    assert body.read == 3
+    assert body.closed
+
+
+def test_entities_unchanged(engine):
+    # The module level table of html.entities is left as it is
+    from html.entities import name2codepoint
+    assert "apos" not in name2codepoint
+    assert quick_parsehtml("<p>it&apos;s</p>", engine=engine).findtext(".//p") == "it's"
+
+
+def test_threads():
+    # Filters, query sets and compact trees are shared between threads, every thread gets the same results
+    pages = ["".join(("<html><body>", "<div class='row' id='r{0}'><a href='/{0}/{1}'>{1}</a></div>".format(i, j) * 50,
+                      "<div class='row'><x-tag{0} data-{0}='1'>New names</x-tag{0}></div></body></html>".format(i)))
+             for i in range(20) for j in range(2)]
+    section = htmlement.Filter("body")
+    queries = htmlement.QuerySet([".//div[@class='row']/a", ".//a[@href]"])
+    compact = htmlement.fromstring(pages[0], target=htmlement.CompactTreeBuilder())
+
+    def work(html):
+        root = htmlement.fromstring(html, section, engine="fast")
+        found = queries.findall(root)
+        return (Etree.tostring(root), [elem.get("href") for elem in found[".//a[@href]"]],
+                len(compact.findall(".//div[@class='row']/a")))
+
+    expected = [work(html) for html in pages]
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        for _ in range(3):
+            assert list(executor.map(work, pages)) == expected
+
+
+def test_parse_many_threads():
+    pages = ["<html><head><title>{}</title></head></html>".format(i) for i in range(30)]
+    results = htmlement.parse_many(pages, extract=lambda root: root.findtext(".//title"), workers=4, executor="thread")
+    assert [result.result for result in results] == [str(i) for i in range(30)]
+
+    with pytest.raises(ValueError):
+        list(htmlement.parse_many(pages, executor="fiber"))
+
+
+SPLIT_HTML = "<html><body><table><tr><td>Other</td></tr></table><table id='data' class='big'>{}</table><p>After</p>".format(
+    "".join(("<tr><td>{0}</td><td>&amp; {0}</td></tr>",
+             "<tr><td><table><tr><td>{0}</td></tr><tr><td>{0}</td></tr></table></td></tr>",
+             "<!-- </tr><tr> {0} -->",
+             "<tr><td><script>'<tr>{0}'</script></td></tr>",
+             "<tr><td>{0}")[i % 5].format(i)
+            for i in range(100)))
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_parse_split(executor):
+    # Segments that are split within nested tables, comments, scripts or unclosed rows are parsed on with the next ones
+    expected = Etree.tostring(htmlement.fromstring(SPLIT_HTML, "table", {"id": "data"}))
+    for size in (10, 100, len(SPLIT_HTML)):
+        root = htmlement.parse_split(SPLIT_HTML, "table", {"id": "data"}, segment_size=size, workers=3, executor=executor)
+        assert Etree.tostring(root) == expected
+
+
+def test_itersplit():
+    expected = [Etree.tostring(elem) for elem in htmlement.fromstring(SPLIT_HTML, "table", {"id": "data"})]
+    rows = htmlement.itersplit(SPLIT_HTML.encode("utf-8"), "table", {"id": "data"}, "tr", segment_size=50,
+                               executor="thread", encoding="utf-8")
+    assert [Etree.tostring(elem) for elem in rows] == expected
+
+    with pytest.raises(RuntimeError):
+        htmlement.parse_split(SPLIT_HTML, "table", {"id": "missing"}, executor="thread")
+
+
+def test_parse_cache():
+    cache = htmlement.ParseCache()
+    html = "<html><body><div id='main'>Text</div></body></html>"
+    root = cache.fromstring(html, "div", {"id": "main"})
+    cached = cache.fromstring(html, "div", {"id": "main"})
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert Etree.tostring(cached) == Etree.tostring(root)
+
+    # Every hit is a copy, so changing it does not change the cache
+    cached.text = "Changed"
+    assert cache.fromstring(html, "div", {"id": "main"}).text == "Text"
+
+    # The document, its type and the parameters are all part of the key
+    cache.fromstring(html)
+    cache.fromstring(html.encode("utf-8"), "div", {"id": "main"}, encoding="utf-8")
+    cache.fromstring(html, "div", {"id": re.compile("ma")}, skip_tags={"p"})
+    assert (cache.hits, cache.misses) == (2, 4)
+
+    with pytest.raises(TypeError):
+        cache.fromstring(html, "div", {"id": lambda value: True})
+
+
+def test_parse_cache_evict(tmp_path):
+    pages = ["<html><body><p>{}</p>{}</body></html>".format(i, "x" * 1000) for i in range(10)]
+    cache = htmlement.ParseCache(max_bytes=5000, directory=str(tmp_path))
+    for html in pages:
+        cache.fromstring(html)
+    assert 0 < len(cache) < 10
+    assert cache.nbytes <= 5000
+
+    # The evicted trees are still kept in the directory, by any other cache
+    other = htmlement.ParseCache(directory=str(tmp_path))
+    assert [other.fromstring(html).findtext(".//p") for html in pages] == [str(i) for i in range(10)]
+    assert (other.hits, other.misses) == (10, 0)
+
+
+@pytest.mark.parametrize("html", [
+    "hi<html><head><title>T</title></head></html>",
+    "<p>a</p><html><head><title>T</title></head></html>",
+    "\ufeff<!DOCTYPE html>\n<html><head><title>T</title></head></html>".encode("utf-8"),
+])
+def test_content_before_html(html):
+    # The html element of the document is returned, not the html root element that was created for the content
+    root = htmlement.fromstring(html, encoding="utf-8")
+    assert root.tag == "html"
+    assert root.find("html") is None
+    assert root.findtext("head/title") == "T"
+
+
+def test_comment_before_element(engine):
+    root = quick_parsehtml("<!-- note --><p>text</p>", engine=engine)
+    assert root[0].tag is Etree.Comment
+    assert root[0].text == "note"
+    assert root.findtext("p") == "text"
+
+
+def test_self_closing_html(engine):
+    # The rest of the document is still within a self closing html element
+    root = quick_parsehtml("<html/><p>text</p>", engine=engine)
+    assert Etree.tostring(root) == b"<html><p>text</p></html>"
+    assert Etree.tostring(quick_parsehtml("<html/>", engine=engine)) == b"<html />"
+
+
+@pytest.mark.parametrize("encoding", ["utf-16le", "utf-16be"])
+def test_transport_encoding_utf16(encoding):
+    # Only utf-16 declared in the markup is overridden, not utf-16 given by the transport layer
+    root = htmlement.fromstring("<p>hé</p>".encode(encoding), transport_encoding=encoding)
+    assert root.findtext("p") == "hé"